@@ -1,11 +1,19 @@
+from environment import *
+from opponent_model import *
+
 class ForwardSearchPlayer(Player):
-    def __init__(self, max_depth=3, node_budget=1000, discount_factor=0.95):
+    def __init__(self, max_depth=3, node_budget=1000, discount_factor=0.95, time_budget_ms=None, opponent_model=None):
         self.max_depth = max_depth
         self.node_budget = node_budget
         self.nodes_visited = 0
+        self.time_budget_ms = time_budget_ms  # Default wall-clock budget per decision, None for no deadline
+        self.deadline = None  # time.perf_counter() value at which the running search stops expanding
+        self.stop_reason = None  # Why the running search stopped expanding, None while it has not
+        self.last_search_report = None  # SearchReport of the last choose_action
         self.discount_factor = discount_factor
         # Initialize belief as uniform distribution over opponent cards
         self.belief_state = {card: 1/3 for card in KuhnPokerState.DECK}
+        self.opponent_model = opponent_model  # OpponentModel learned across episodes, replaces the fixed likelihoods if set
         
     def initialize_belief(self, player_card: int):
         """Initialize belief as uniform distribution over the two possible opponent cards"""
@@ -13,6 +21,9 @@ class ForwardSearchPlayer(Player):
         
     def update_belief(self, history: KuhnPokerHistory, player_id: int):
         """Update beliefs based on observed actions"""
+        if self.opponent_model is not None:
+            self.belief_state = self.opponent_model.posterior(history)
+            return
         last_obs = history.get_last_observation()
         
         # Initialize belief if this is our first observation
@@ -66,7 +77,12 @@ class ForwardSearchPlayer(Player):
         self.nodes_visited += 1
         current_obs = history.get_last_observation()
         
-        if self.nodes_visited >= self.node_budget or depth <= 0 or current_obs.is_terminal():
+        # the root is always expanded so that there is an action to return
+        if depth < self.max_depth and self.nodes_visited >= self.node_budget:
+            self.stop_reason = StopReason.NODE_BUDGET
+        elif depth < self.max_depth and self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stop_reason = StopReason.DEADLINE
+        if self.stop_reason is not None or depth <= 0 or current_obs.is_terminal():
             return {'action': None, 'value': self.value_function(current_obs)}
         
         legal_actions = history.get_legal_actions()
@@ -96,12 +112,12 @@ class ForwardSearchPlayer(Player):
                 state = KuhnPokerState.init_from_observation(current_obs, opp_card)
                 
                 # Simulate action
-                if action in state.get_legal_actions():
-                    state.apply_action(action, player_id)
+                if state.is_legal_action(action):
+                    # deeper in the search the opponent may be the one acting
+                    state = state.apply_action(action, state.current_player())
                     
                     # Create new history with the new observation
-                    new_history = history.copy()
-                    new_history.observations.append(state.get_observation(player_id))
+                    new_history = history.append(state.get_observation(player_id))
                     
                     if state.is_terminal():
                         returns = state.get_returns()
@@ -113,14 +129,28 @@ class ForwardSearchPlayer(Player):
         
         return expected_value
     
-    def choose_action(self, history: KuhnPokerHistory, player_id: int) -> int:
-        """Main method to select an action"""
+    def choose_action(self, history: KuhnPokerHistory, player_id: int, deadline_ms=None) -> int:
+        """Main method to select an action, searching for at most deadline_ms milliseconds (time_budget_ms if not given)"""
+        start = time.perf_counter()
+        if deadline_ms is None:
+            deadline_ms = self.time_budget_ms
+        self.deadline = start + deadline_ms / 1000 if deadline_ms is not None else None
+        self.stop_reason = None
         self.nodes_visited = 0  # Reset node count
         self.update_belief(history, player_id)
         
         result = self.forward_search(history, self.max_depth, player_id)
+        self.last_search_report = SearchReport(action=result['action'], budget_used=self.nodes_visited,
+                                               elapsed_ms=(time.perf_counter() - start) * 1000,
+                                               stop_reason=self.stop_reason or StopReason.COMPLETE,
+                                               best_value=result['value'])
         return result['action']
     
+    def end_episode(self, history: KuhnPokerHistory, player_id: int, opponent_card=None):
+        """Let the opponent model count the opponent's actions of the finished episode"""
+        if self.opponent_model is not None:
+            self.opponent_model.observe(history, opponent_card)
+
     def get_policy(self) -> Dict:
         """Return the current policy (empty as policy is computed online)"""
         return {}
\ No newline at end of file
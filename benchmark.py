@@ -0,0 +1,181 @@
+'''
+Reproducible performance benchmarks for the Kuhn poker players.
+
+For every player class this measures search throughput, choose_action latency (p50/p99), peak
+memory and bytes per tree node, plus Simulator episodes per second against a RandomPlayer.
+Seeds are fixed and the output is JSON with sorted keys, so two runs can be diffed directly:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+'''
+import argparse
+import itertools
+import json
+import platform
+import sys
+import tracemalloc
+from mcts import *
+from mcts_fixed_width import FixedWidthMCTSPlayer
+from mcts_human_crafted import HumanCraftedMCTSPlayer
+from mcts_progressive_widening import ProgressiveWideningMCTSPlayer
+from mcts_pw_similarity import PWSimilarityMCTSPlayer
+from Kuhn_poker_forward_search import ForwardSearchPlayer
+
+NUM_SIMULATIONS = 200
+EXPLORATION_CONSTANT = 1.0
+
+PLAYER_FACTORIES = {
+    'HistoryMCTSPlayer': lambda: HistoryMCTSPlayer(NUM_SIMULATIONS, EXPLORATION_CONSTANT),
+    'FixedWidthMCTSPlayer': lambda: FixedWidthMCTSPlayer(NUM_SIMULATIONS, EXPLORATION_CONSTANT, fixed_width=3),
+    'HumanCraftedMCTSPlayer': lambda: HumanCraftedMCTSPlayer(NUM_SIMULATIONS, EXPLORATION_CONSTANT, fixed_width=3),
+    'ProgressiveWideningMCTSPlayer': lambda: ProgressiveWideningMCTSPlayer(NUM_SIMULATIONS, EXPLORATION_CONSTANT, theta_1=1.5, theta_2=0.5),
+    'PWSimilarityMCTSPlayer': lambda: PWSimilarityMCTSPlayer(NUM_SIMULATIONS, EXPLORATION_CONSTANT, theta_1=1.5, theta_2=0.5),
+    'ForwardSearchPlayer': lambda: ForwardSearchPlayer(),
+}
+
+# Bets faced by player 1 in the benchmark decisions (0 is a check)
+BENCHMARK_BETS = (0, 1, 10, 50, 100)
+
+
+def benchmark_decisions() -> List[Tuple[KuhnPokerHistory, int]]:
+    '''
+    The fixed set of decision points every player is timed on: player 0's opening decision with each
+    card, and player 1's response to a check and to several bet sizes with each card.
+    '''
+    decisions = []
+    for hands in itertools.permutations(KuhnPokerState.DECK, 2):
+        state = KuhnPokerState(hands)
+        decisions.append((KuhnPokerHistory([state.get_observation(0)]), 0))
+        for bet in BENCHMARK_BETS:
+            next_state = state.apply_action(bet, 0)
+            decisions.append((KuhnPokerHistory([state.get_observation(1), next_state.get_observation(1)]), 1))
+    return decisions
+
+
+def search_units(player: Player) -> int:
+    '''
+    Work done by the last choose_action: simulations of all workers for MCTS players, visited nodes for forward search.
+    '''
+    report = getattr(player, 'last_search_report', None)
+    return report.budget_used if report is not None else 0
+
+
+def tree_size(player: Player) -> Tuple[int, int]:
+    '''
+    Returns the number of tree nodes and the bytes of the tree's statistics arrays (0, 0 without a tree).
+    '''
+    tree = getattr(player, 'tree', None)
+    if tree is None:
+        return 0, 0
+    return len(tree), tree.nbytes
+
+
+def benchmark_player(name: str, repeats: int, episodes: int, seed: int) -> Dict:
+    decisions = benchmark_decisions()
+
+    # latency and throughput, on a fresh player so the tree grows the same way every run
+    seed_process(seed)
+    player = PLAYER_FACTORIES[name]()
+    latencies = []
+    units = 0
+    for _ in range(repeats):
+        for history, player_id in decisions:
+            start = time.perf_counter()
+            player.choose_action(history, player_id)
+            latencies.append(time.perf_counter() - start)
+            units += search_units(player)
+    total_time = sum(latencies)
+    nodes, tree_bytes = tree_size(player)
+
+    # memory, measured in a separate pass because tracing slows everything down
+    # tracing starts before the player is built, so memory allocated at construction counts towards the peak
+    seed_process(seed)
+    tracemalloc.start()
+    player = PLAYER_FACTORIES[name]()
+    for history, player_id in decisions:
+        player.choose_action(history, player_id)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    traced_nodes, _ = tree_size(player)
+
+    # full episodes against a random opponent
+    seed_process(seed)
+    simulator = Simulator([PLAYER_FACTORIES[name](), RandomPlayer()])
+    start = time.perf_counter()
+    simulator.simulate_episodes(episodes)
+    episode_time = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'decisions': len(latencies),
+        'search_units': units,
+        'search_units_per_sec': units / total_time if total_time > 0 else 0.0,
+        'latency_ms_p50': float(np.percentile(latencies_ms, 50)),
+        'latency_ms_p99': float(np.percentile(latencies_ms, 99)),
+        'latency_ms_mean': float(latencies_ms.mean()),
+        'peak_memory_bytes': peak_memory,
+        'tree_nodes': nodes,
+        'tree_array_bytes': tree_bytes,
+        'tree_array_bytes_per_node': tree_bytes / nodes if nodes > 0 else None,
+        'peak_memory_bytes_per_node': peak_memory / traced_nodes if traced_nodes > 0 else None,
+        'simulator_episodes': episodes,
+        'simulator_episodes_per_sec': episodes / episode_time if episode_time > 0 else 0.0,
+    }
+
+
+def run_benchmarks(players: List[str], repeats: int, episodes: int, seed: int) -> Dict:
+    return {
+        'config': {
+            'seed': seed,
+            'repeats': repeats,
+            'episodes': episodes,
+            'num_simulations': NUM_SIMULATIONS,
+            'exploration_constant': EXPLORATION_CONSTANT,
+            'decision_points': len(benchmark_decisions()),
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'players': {name: benchmark_player(name, repeats, episodes, seed) for name in players},
+    }
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    '''
+    One line per metric that both runs report, with the relative change against the baseline.
+    '''
+    lines = []
+    for name, metrics in results['players'].items():
+        baseline_metrics = baseline.get('players', {}).get(name)
+        if baseline_metrics is None:
+            continue
+        for metric, value in metrics.items():
+            old = baseline_metrics.get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old != 0:
+                lines.append(f"{name:32s} {metric:32s} {old:14.4f} -> {value:14.4f} ({(value - old) / old:+.1%})")
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', nargs='+', choices=sorted(PLAYER_FACTORIES), default=list(PLAYER_FACTORIES))
+    parser.add_argument('--repeats', type=int, default=3, help='passes over the decision points per player')
+    parser.add_argument('--episodes', type=int, default=100, help='Simulator episodes per player')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.players, args.repeats, args.episodes, args.seed)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(results, baseline)), file=sys.stderr)
@@ -0,0 +1,137 @@
+from policy_table import *
+
+
+class CFRVariant(str, enum.Enum):
+    CFR_PLUS = 'cfr+'  # Regrets floored at 0, linearly weighted average strategy
+    DCFR = 'dcfr'  # Discounted CFR: positive and negative regrets and the average strategy decay at separate rates
+
+
+def regret_matching(regrets: np.ndarray) -> np.ndarray:
+    '''
+    Strategy proportional to the positive regrets along the last axis, uniform where no regret is positive.
+    '''
+    positive = np.maximum(regrets, 0.0)
+    totals = positive.sum(axis=-1, keepdims=True)
+    return np.divide(positive, totals, out=np.full_like(positive, 1.0 / regrets.shape[-1]), where=totals > 0)
+
+
+def normalized(strategy_sum: np.ndarray) -> np.ndarray:
+    totals = strategy_sum.sum(axis=-1, keepdims=True)
+    return np.divide(strategy_sum, totals, out=np.full_like(strategy_sum, 1.0 / strategy_sum.shape[-1]), where=totals > 0)
+
+
+class CFRSolver:
+    '''
+    Counterfactual regret minimization over the whole game at once.
+
+    Regrets and strategy sums of every information set and bet size are NumPy arrays laid out as in
+    policy_table (player 0: (card, bet), player 1: (card, bet faced, response)). Every player acts at most
+    once per hand, so an iteration is a few array operations over all 6 deals and 101 bet sizes: the
+    counterfactual action values of one player are the payoffs weighted by the deal probabilities and the
+    other player's current strategy. Players are updated alternately, player 0 first.
+    '''
+    def __init__(self, variant: str = CFRVariant.DCFR, alpha: float = 1.5, beta: float = 0.0, gamma: float = 2.0):
+        self.variant = CFRVariant(variant)
+        self.alpha = alpha  # DCFR discount exponent of positive regrets
+        self.beta = beta  # DCFR discount exponent of negative regrets
+        self.gamma = gamma  # DCFR discount exponent of the average strategy
+        self.regrets_0 = np.zeros((NUM_CARDS, NUM_BET_SIZES))
+        self.regrets_1 = np.zeros((NUM_CARDS, NUM_BET_SIZES, 2))
+        self.strategy_sum_0 = np.zeros((NUM_CARDS, NUM_BET_SIZES))
+        self.strategy_sum_1 = np.zeros((NUM_CARDS, NUM_BET_SIZES, 2))
+        self.iteration = 0  # Iterations run so far
+
+    def current_strategy(self) -> Tuple[np.ndarray, np.ndarray]:
+        return regret_matching(self.regrets_0), regret_matching(self.regrets_1)
+
+    def average_strategy(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        The average strategies of both players, which converge to a Nash equilibrium.
+        '''
+        return normalized(self.strategy_sum_0), normalized(self.strategy_sum_1)
+
+    def _update_regrets(self, regrets: np.ndarray, instant_regrets: np.ndarray, t: int) -> np.ndarray:
+        regrets = regrets + instant_regrets
+        if self.variant == CFRVariant.CFR_PLUS:
+            return np.maximum(regrets, 0.0)
+        positive_discount = t ** self.alpha / (t ** self.alpha + 1)
+        negative_discount = t ** self.beta / (t ** self.beta + 1)
+        return regrets * np.where(regrets > 0, positive_discount, negative_discount)
+
+    def _update_strategy_sum(self, strategy_sum: np.ndarray, strategy: np.ndarray, t: int) -> np.ndarray:
+        if self.variant == CFRVariant.CFR_PLUS:
+            return strategy_sum + t * strategy
+        return strategy_sum * (t / (t + 1)) ** self.gamma + strategy
+
+    def iterate(self, num_iterations: int = 1):
+        for _ in range(num_iterations):
+            t = self.iteration + 1
+            strategy_0, strategy_1 = self.current_strategy()
+
+            # player 0: value of opening with each bet, against player 1's responses
+            values_0 = opening_values(strategy_1)
+            node_values_0 = (strategy_0 * values_0).sum(axis=-1, keepdims=True)
+            self.regrets_0 = self._update_regrets(self.regrets_0, values_0 - node_values_0, t)
+            self.strategy_sum_0 = self._update_strategy_sum(self.strategy_sum_0, strategy_0, t)
+            strategy_0 = regret_matching(self.regrets_0)
+
+            # player 1: value of each response, reached with the probability player 0 makes the bet
+            values_1 = response_values(strategy_0)
+            node_values_1 = (strategy_1 * values_1).sum(axis=-1, keepdims=True)
+            self.regrets_1 = self._update_regrets(self.regrets_1, values_1 - node_values_1, t)
+            self.strategy_sum_1 = self._update_strategy_sum(self.strategy_sum_1, strategy_1, t)
+            self.iteration = t
+
+    def solve(self, num_iterations: int, checkpoint_path: Optional[str] = None, checkpoint_interval: int = 1000):
+        '''
+        Runs iterations until num_iterations have been run in total, so a solver resumed from a checkpoint
+        only runs the remaining ones. With checkpoint_path set, a checkpoint is written every
+        checkpoint_interval iterations and at the end.
+        '''
+        while self.iteration < num_iterations:
+            self.iterate(min(checkpoint_interval, num_iterations - self.iteration))
+            if checkpoint_path is not None:
+                self.save(checkpoint_path)
+
+    def game_value(self) -> float:
+        '''
+        Expected return of player 0 when both players play their average strategies.
+        '''
+        strategy_0, strategy_1 = self.average_strategy()
+        return float((strategy_0 * opening_values(strategy_1)).sum())
+
+    def save(self, path: str):
+        np.savez(path, regrets_0=self.regrets_0, regrets_1=self.regrets_1, strategy_sum_0=self.strategy_sum_0,
+                 strategy_sum_1=self.strategy_sum_1, iteration=self.iteration, variant=self.variant.value,
+                 discounts=np.array([self.alpha, self.beta, self.gamma]))
+
+    @staticmethod
+    def load(path: str) -> 'CFRSolver':
+        with np.load(path) as checkpoint:
+            alpha, beta, gamma = checkpoint['discounts']
+            solver = CFRSolver(str(checkpoint['variant']), alpha=float(alpha), beta=float(beta), gamma=float(gamma))
+            solver.regrets_0 = checkpoint['regrets_0']
+            solver.regrets_1 = checkpoint['regrets_1']
+            solver.strategy_sum_0 = checkpoint['strategy_sum_0']
+            solver.strategy_sum_1 = checkpoint['strategy_sum_1']
+            solver.iteration = int(checkpoint['iteration'])
+        return solver
+
+    def to_policy_table(self) -> PolicyTable:
+        return PolicyTable.from_tensors(*self.average_strategy())
+
+    def player(self, greedy: bool = False) -> TablePlayer:
+        '''
+        A player for either seat that plays the average strategy.
+        '''
+        return TablePlayer(self.to_policy_table(), greedy=greedy)
+
+
+if __name__ == '__main__':
+    solver = CFRSolver()
+    start = time.perf_counter()
+    solver.solve(10000)
+    print(f"{solver.iteration} iterations in {time.perf_counter() - start:.2f}s, game value {solver.game_value():.4f}")
+    simulator = Simulator([solver.player(), RandomPlayer()])
+    results = simulator.simulate_episodes(1000)
+    print(results)
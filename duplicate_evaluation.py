@@ -0,0 +1,79 @@
+from sequential_testing import *
+from policy_table import *
+
+
+@dataclass
+class DuplicateReport:
+    '''
+    Result of a duplicate match of player A (the simulator's player 0) against player B (its player 1).
+    Profits are player 0's returns and their negation for player 1, as in evaluation.py.
+    '''
+    deals: int  # Deals played, each twice
+    ev: float  # A's average profit per episode against B
+    standard_error: float
+    ev_as_player_0: float  # A's average profit in seat 0
+    ev_as_player_1: float  # A's average profit in seat 1
+    stratified: bool
+
+
+def duplicate_deals(num_deals: int, stratified: bool) -> Iterator[Tuple[int, int]]:
+    '''
+    Yields the deals of a duplicate match: uniformly random ones, or with stratified set, every one of the 6 deals
+    once per block of 6, in random order within the block.
+    '''
+    if not stratified:
+        for _ in range(num_deals):
+            yield tuple(random.sample(KuhnPokerState.DECK, 2))
+        return
+    if num_deals % len(DEALS) != 0:
+        raise ValueError(f"Stratified dealing needs a multiple of {len(DEALS)} deals, got {num_deals}")
+    for _ in range(num_deals // len(DEALS)):
+        yield from random.sample(DEALS, len(DEALS))
+
+
+def simulate_duplicate(simulator: Simulator, num_deals: int, stratified: bool = False,
+                       seed: Optional[int] = None) -> DuplicateReport:
+    '''
+    Plays every deal twice with the same cards in the same seats and the players swapped, so the cards each
+    player holds cancel out of the comparison.
+
+    A deal's paired difference is A's profit with the seat-0 cards minus B's profit with the same cards, halved:
+    A's average profit per episode over the pair. The standard error is taken over these differences, or with
+    stratified dealing (equal counts of all 6 deals in both seat orders), over the averages of blocks of 6 deals.
+    '''
+    if seed is not None:
+        seed_process(seed)
+    player_a, player_b = simulator.players
+    swapped = Simulator([player_b, player_a], verbose=simulator.verbose)
+    differences = RunningMoments()  # Per pair, or per block when stratified
+    block = RunningMoments()
+    seat_0_profit = 0.0
+    seat_1_profit = 0.0
+    deals = 0
+    for hands in duplicate_deals(num_deals, stratified):
+        a_first = simulator.play_episode(hands).get_returns()[0]
+        b_first = swapped.play_episode(hands).get_returns()[0]
+        seat_0_profit += a_first
+        seat_1_profit -= b_first
+        difference = (a_first - b_first) / 2
+        deals += 1
+        if not stratified:
+            differences.add(difference)
+            continue
+        block.add(difference)
+        if block.count == len(DEALS):
+            differences.add(block.mean)
+            block = RunningMoments()
+    return DuplicateReport(deals=deals, ev=(seat_0_profit + seat_1_profit) / (2 * deals),
+                           standard_error=differences.standard_error() if differences.count > 1 else math.inf,
+                           ev_as_player_0=seat_0_profit / deals, ev_as_player_1=seat_1_profit / deals,
+                           stratified=stratified)
+
+
+if __name__ == '__main__':
+    from mcts import HistoryMCTSPlayer
+    from mcts_fixed_width import FixedWidthMCTSPlayer
+
+    simulator = Simulator([HistoryMCTSPlayer(num_simulations=100, exploration_constant=1.0),
+                           FixedWidthMCTSPlayer(num_simulations=100, exploration_constant=1.0, fixed_width=3)])
+    print(simulate_duplicate(simulator, 120, stratified=True, seed=0))
@@ -1,13 +1,16 @@
 import enum
 import random
-import copy
 import math
+import weakref
+import concurrent.futures
+import time
 import numpy as np
-from typing import Hashable, List, Dict, Optional, Tuple, Callable
+from typing import Hashable, Iterable, Iterator, List, Dict, NamedTuple, Optional, Tuple, Callable
 from collections import defaultdict
 import matplotlib.pyplot as plt
 from abc import abstractmethod, ABC
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from instrumentation import *
 
 
 
@@ -63,128 +66,301 @@ class PlayerType(enum.IntEnum):
     # Regular players are 0, 1, 2, ...
 
 
-@dataclass
+@dataclass(frozen=True)
 class KuhnPokerObservation:
     player_hand: int
     player_index: int
-    bets: List[int]
+    bets: Tuple[int, ...]
     current_player: int
-    folded: List[bool]
+    folded: Tuple[bool, ...]
     bet_amount: Optional[int]
     winner: Optional[int] = None
+    _hash: int = field(init=False, repr=False, compare=False)
 
-    def get_legal_actions(self) -> List[int]:
-        if self.is_terminal():
-            return []
-        elif self.bet_amount is None:
-            return [ActionType.CHECK] + list(range(1, KuhnPokerState.MAX_BET + 1))
-        else:
-            return [ActionType.FOLD, self.bet_amount]
+    def __post_init__(self):
+        # observations are immutable snapshots: never alias the state's lists
+        object.__setattr__(self, 'bets', tuple(self.bets))
+        object.__setattr__(self, 'folded', tuple(self.folded))
+        object.__setattr__(self, '_hash', hash((self.player_hand, self.player_index, self.bets, self.current_player, self.folded, self.bet_amount, self.winner)))
+
+    def get_legal_actions(self) -> Tuple[int, ...]:
+        return KuhnPokerState.legal_actions_for(self.bet_amount, self.current_player)
         
     def is_terminal(self) -> bool:
         return self.current_player == PlayerType.TERMINAL
     
     def __hash__(self) -> int:
-        return hash((self.player_hand, self.player_index, tuple(self.bets), self.current_player, tuple(self.folded), self.bet_amount, self.winner))
+        return self._hash
     
     def copy(self) -> 'KuhnPokerObservation':
-        return copy.deepcopy(self)
+        return self
+
+    def action_to(self, next_observation: 'KuhnPokerObservation') -> int:
+        '''
+        The action of the player to act in this observation that led to next_observation.
+        '''
+        player = self.current_player
+        if next_observation.folded[player]:
+            return ActionType.FOLD
+        if self.bet_amount is None:  # opening: check (bet amount 0) or bet
+            return next_observation.bet_amount
+        return self.bet_amount  # call
+
+    def with_perspective(self, player_index: int, player_hand: int) -> 'KuhnPokerObservation':
+        '''
+        Returns the same observation as seen by another player (self if the perspective is unchanged).
+        '''
+        if self.player_index == player_index and self.player_hand == player_hand:
+            return self
+        return KuhnPokerObservation(
+            player_hand=player_hand,
+            player_index=player_index,
+            bets=self.bets,
+            current_player=self.current_player,
+            folded=self.folded,
+            bet_amount=self.bet_amount,
+            winner=self.winner
+        )
+
+
+class InfosetKey(NamedTuple):
+    '''
+    Canonical key of an information set: the acting player's own card, its position and the actions taken so far.
+    Histories that differ only in redundant observation fields or in perspective map to the same key.
+    '''
+    card: int
+    player: int
+    actions: Tuple[int, ...]
+
+    def get_legal_actions(self) -> Tuple[int, ...]:
+        if not self.actions:
+            return KuhnPokerState.OPENING_ACTIONS
+        if len(self.actions) == 1 and self.actions[0] != ActionType.FOLD:
+            return KuhnPokerState.RESPONSE_ACTIONS[self.actions[0]]
+        return ()
+
 
-@dataclass
 class KuhnPokerHistory:
-    observations: List[KuhnPokerObservation]
+    '''
+    Immutable, structurally shared sequence of observations.
+
+    A history is a parent pointer plus the last observation. Instances are hash-consed: building
+    the same sequence twice returns the same object, so equality is identity and the hash is
+    computed once. Appending an observation allocates one small node.
+    '''
+    __slots__ = ('parent', 'observation', 'length', '_hash', '_observations', '_switched', '_actions', '_infoset_key', '__weakref__')
+    _interned = weakref.WeakValueDictionary()  # Maps (parent, observation) -> history
+
+    def __new__(cls, observations: Iterable[KuhnPokerObservation] = ()) -> 'KuhnPokerHistory':
+        history = None
+        for observation in observations:
+            history = cls._make(history, observation)
+        if history is None:
+            raise ValueError("A history needs at least one observation")
+        return history
+
+    @classmethod
+    def _make(cls, parent: Optional['KuhnPokerHistory'], observation: KuhnPokerObservation) -> 'KuhnPokerHistory':
+        key = (parent, observation)
+        history = cls._interned.get(key)
+        if history is None:
+            history = object.__new__(cls)
+            history.parent = parent
+            history.observation = observation
+            history.length = 1 if parent is None else parent.length + 1
+            history._hash = hash(key)
+            history._observations = None
+            history._switched = None
+            history._actions = None
+            history._infoset_key = None
+            cls._interned[key] = history
+        return history
+
+    def __reduce__(self):
+        # unpickling goes through __new__ so the copy is interned in the receiving process
+        return (KuhnPokerHistory, (self.observations,))
+
+    @property
+    def observations(self) -> Tuple[KuhnPokerObservation, ...]:
+        if self._observations is None:
+            prefix = self.parent.observations if self.parent is not None else ()
+            self._observations = prefix + (self.observation,)
+        return self._observations
+
+    @property
+    def actions(self) -> Tuple[int, ...]:
+        '''
+        The actions taken along the history, extended from the parent's on first access.
+        '''
+        if self._actions is None:
+            self._actions = () if self.parent is None else self.parent.actions + (self.parent.observation.action_to(self.observation),)
+        return self._actions
 
-    def get_legal_actions(self) -> List[int]:
-        return self.observations[-1].get_legal_actions()
+    @property
+    def infoset_key(self) -> InfosetKey:
+        '''
+        The canonical key of the information set of the history's last observation.
+        '''
+        if self._infoset_key is None:
+            self._infoset_key = InfosetKey(self.observation.player_hand, self.observation.player_index, self.actions)
+        return self._infoset_key
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        return f"KuhnPokerHistory(observations={list(self.observations)})"
+
+    def get_legal_actions(self) -> Tuple[int, ...]:
+        return self.observation.get_legal_actions()
     
     def copy(self) -> 'KuhnPokerHistory':
-        return copy.deepcopy(self)
-    
-    def __hash__(self) -> int:
-        return hash(tuple(self.observations))
+        return self
+
+    def decisions(self) -> List[Tuple['KuhnPokerHistory', int, int]]:
+        '''
+        The decisions made along the history, in order: the history they were made at, the acting player and the action.
+        '''
+        decisions = []
+        history = self
+        while history.parent is not None:
+            before = history.parent.observation
+            decisions.append((history.parent, before.current_player, before.action_to(history.observation)))
+            history = history.parent
+        decisions.reverse()
+        return decisions
+
+    def append(self, observation: KuhnPokerObservation) -> 'KuhnPokerHistory':
+        '''
+        Returns the history extended by one observation. The current history is not modified.
+        '''
+        return KuhnPokerHistory._make(self, observation)
     
     def get_current_player(self) -> int:
-        return self.observations[-1].current_player
+        return self.observation.current_player
     
     def get_last_observation(self) -> KuhnPokerObservation:
-        return self.observations[-1]
+        return self.observation
     
     def switch_perspective(self, player_id: int, player_card: int) -> 'KuhnPokerHistory':
         '''
-        Switches the player_card and player_id in all observations in the history. Returns new history (deep copy).
+        Returns the history with player_card and player_id set in all observations.
+        Results are memoized per history, so repeated switches are a dict lookup.
         '''
-        new_observations = []
-        for observation in self.observations:
-            new_observation = observation.copy()
-            new_observation.player_index = player_id
-            new_observation.player_hand = player_card
-            new_observations.append(new_observation)
-        return KuhnPokerHistory(observations=new_observations)
+        perspective = (player_id, player_card)
+        if self._switched is None:
+            self._switched = {}
+        switched = self._switched.get(perspective)
+        if switched is None:
+            parent = self.parent.switch_perspective(player_id, player_card) if self.parent is not None else None
+            switched = KuhnPokerHistory._make(parent, self.observation.with_perspective(player_id, player_card))
+            self._switched[perspective] = switched
+        return switched
 
 
 class KuhnPokerState:
+    '''
+    Immutable game state. apply_action returns a new state instead of modifying this one,
+    so states can be shared freely without copying.
+    '''
     DECK = tuple([0, 1, 2])  # Cards are dealt from this deck
     MAX_BET = 100  # Maximum bet amount
+    OPENING_ACTIONS = tuple([ActionType.CHECK] + list(range(1, MAX_BET + 1)))  # Legal actions before any bet
+    RESPONSE_ACTIONS = {bet: (ActionType.FOLD, bet) for bet in range(MAX_BET + 1)}  # Maps bet_amount -> legal actions
+
+    __slots__ = ('players_hands', 'bets', 'folded', 'current_player_index', 'bet_amount', 'winner')
 
-    def __init__(self):
-        self.players_hands = random.sample(KuhnPokerState.DECK, 2)  # Deal two cards to two players
-        self.bets = [1, 1]  # Individual player bets. Ante is 1
-        self.folded = [False, False]  # Track if players have folded
+    def __init__(self, players_hands: Optional[Tuple[int, int]] = None):
+        self.players_hands = tuple(players_hands) if players_hands is not None else tuple(random.sample(KuhnPokerState.DECK, 2))  # Deal two cards to two players
+        self.bets = (1, 1)  # Individual player bets. Ante is 1
+        self.folded = (False, False)  # Track if players have folded
         self.current_player_index = 0  # Random starting player
         self.bet_amount = None  # Amount of the bet. None if no bet has been made
         self.winner = None  # Winner of the game
 
     @staticmethod
-    def init_from_observation(observation: KuhnPokerObservation, opponent_card: int) -> 'KuhnPokerState':
-        state = KuhnPokerState()
-        state.players_hands = [0, 0]
-        state.players_hands[observation.player_index] = observation.player_hand
-        state.players_hands[1 - observation.player_index] = opponent_card
-        state.bets = observation.bets
-        state.folded = observation.folded
-        state.current_player_index = observation.current_player
-        state.bet_amount = observation.bet_amount
-        state.winner = observation.winner
+    def _make(players_hands: Tuple[int, ...], bets: Tuple[int, ...], folded: Tuple[bool, ...], current_player_index: int,
+              bet_amount: Optional[int], winner: Optional[int]) -> 'KuhnPokerState':
+        state = object.__new__(KuhnPokerState)
+        state.players_hands = players_hands
+        state.bets = bets
+        state.folded = folded
+        state.current_player_index = current_player_index
+        state.bet_amount = bet_amount
+        state.winner = winner
         return state
 
-    def apply_action(self, action: int, player: int):
+    @staticmethod
+    def init_from_observation(observation: KuhnPokerObservation, opponent_card: int) -> 'KuhnPokerState':
+        players_hands = [0, 0]
+        players_hands[observation.player_index] = observation.player_hand
+        players_hands[1 - observation.player_index] = opponent_card
+        return KuhnPokerState._make(tuple(players_hands), observation.bets, observation.folded,
+                                    observation.current_player, observation.bet_amount, observation.winner)
+
+    @staticmethod
+    def legal_actions_for(bet_amount: Optional[int], current_player: int) -> Tuple[int, ...]:
+        '''
+        Returns the cached, immutable tuple of legal actions for a betting situation.
+        '''
+        if current_player == PlayerType.TERMINAL:
+            return ()
+        elif bet_amount is None:
+            return KuhnPokerState.OPENING_ACTIONS
+        else:
+            return KuhnPokerState.RESPONSE_ACTIONS[bet_amount]
+
+    def is_legal_action(self, action: int) -> bool:
+        if self.current_player_index == PlayerType.TERMINAL:
+            return False
+        elif self.bet_amount is None:
+            return ActionType.CHECK <= action <= KuhnPokerState.MAX_BET
+        else:
+            return action == ActionType.FOLD or action == self.bet_amount
+
+    def apply_action(self, action: int, player: int) -> 'KuhnPokerState':
+        '''
+        Returns the state reached by the action. This state is left unchanged.
+        '''
         if self.current_player_index != player:
             raise ValueError("Not this player's turn!")
 
-        if action not in self.get_legal_actions():
+        if not self.is_legal_action(action):
             raise ValueError("Illegal action!")
 
+        bets = self.bets
         if action == ActionType.FOLD:
-            self.folded[player] = True
-            self.current_player_index = PlayerType.TERMINAL
-            self.winner = 1 - player  # The other player wins
+            folded = (True, self.folded[1]) if player == 0 else (self.folded[0], True)
+            # The other player wins
+            return KuhnPokerState._make(self.players_hands, bets, folded, PlayerType.TERMINAL, self.bet_amount, 1 - player)
         elif action == ActionType.CHECK:
             if self.bet_amount is None:  # First check
-                self.bet_amount = 0
-                self.current_player_index = 1 - player
+                return KuhnPokerState._make(self.players_hands, bets, self.folded, 1 - player, 0, None)
             else:  # Both players checked
-                self.current_player_index = PlayerType.TERMINAL
-                self.determine_winner()
+                return KuhnPokerState._make(self.players_hands, bets, self.folded, PlayerType.TERMINAL, self.bet_amount,
+                                            self.determine_winner())
         else:  # BET or CALL
             if self.bet_amount is None:  # First bet
-                self.bet_amount = action
-                self.bets[player] += action
-                self.current_player_index = 1 - player
+                bets = (bets[0] + action, bets[1]) if player == 0 else (bets[0], bets[1] + action)
+                return KuhnPokerState._make(self.players_hands, bets, self.folded, 1 - player, action, None)
             else:  # CALL
-                self.bets[player] += self.bet_amount
-                self.current_player_index = PlayerType.TERMINAL
-                self.determine_winner()
+                bets = (bets[0] + self.bet_amount, bets[1]) if player == 0 else (bets[0], bets[1] + self.bet_amount)
+                return KuhnPokerState._make(self.players_hands, bets, self.folded, PlayerType.TERMINAL, self.bet_amount,
+                                            self.determine_winner())
 
-    def determine_winner(self):
+    def determine_winner(self) -> int:
         if self.folded[0]:
-            self.winner = 1
+            return 1
         elif self.folded[1]:
-            self.winner = 0
+            return 0
         else:  # Compare hands
             if self.players_hands[0] > self.players_hands[1]:
-                self.winner = 0
+                return 0
             else:
-                self.winner = 1
+                return 1
 
     def get_observation(self, player: int) -> KuhnPokerObservation:
         return KuhnPokerObservation(
@@ -203,13 +379,8 @@ class KuhnPokerState:
     def is_terminal(self) -> bool:
         return self.current_player_index == PlayerType.TERMINAL
 
-    def get_legal_actions(self) -> List[int]:
-        if self.is_terminal():
-            return []
-        elif self.bet_amount is None:
-            return [ActionType.CHECK] + list(range(1, KuhnPokerState.MAX_BET + 1))
-        else:
-            return [ActionType.FOLD, self.bet_amount]
+    def get_legal_actions(self) -> Tuple[int, ...]:
+        return KuhnPokerState.legal_actions_for(self.bet_amount, self.current_player_index)
 
     def get_returns(self) -> dict[int, float]:
         if not self.is_terminal():
@@ -225,15 +396,28 @@ class KuhnPokerState:
             return out
 
     def __str__(self) -> str:
-        return (f"Hands: {self.players_hands}, Bets: {self.bets}, Folded: {self.folded}, "
+        return (f"Hands: {list(self.players_hands)}, Bets: {list(self.bets)}, Folded: {list(self.folded)}, "
                 f"Current Player: {self.current_player_index}, Bet Amount: {self.bet_amount}, "
                 f"Winner: {self.winner}")
 
+    def key(self) -> Tuple:
+        '''
+        Compact tuple identifying the state (the winner follows from the other fields).
+        '''
+        return (self.players_hands, self.bets, self.folded, self.current_player_index, self.bet_amount)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, KuhnPokerState) and self.key() == other.key()
+
     def __hash__(self) -> int:
-        return hash((tuple(self.players_hands), tuple(self.bets), tuple(self.folded), self.current_player_index, self.bet_amount))
+        return hash(self.key())
+
+    def __reduce__(self):
+        return (KuhnPokerState._make, (self.players_hands, self.bets, self.folded, self.current_player_index,
+                                       self.bet_amount, self.winner))
 
     def copy(self) -> 'KuhnPokerState':
-        return copy.deepcopy(self)
+        return self
     
     def get_pot(self) -> int:
         return sum(self.bets)
@@ -250,6 +434,13 @@ class Player:
     def get_policy(self) -> Dict:
         pass
 
+    def end_episode(self, history: KuhnPokerHistory, player_id: int, opponent_card: Optional[int]):
+        '''
+        Called by the Simulator when an episode ends, with the player's final history and the opponent's card if a
+        showdown revealed it (None after a fold). Players that learn across episodes override this.
+        '''
+        pass
+
 class RandomPlayer(Player):
     
     def choose_action(self, history: KuhnPokerHistory, player_id: int) -> int:
@@ -285,115 +476,301 @@ class SimulatorResults:
     total_episodes: int
 
 
-class Simulator:
-    def __init__(self, players: List[Player]):
-        self.players = players
-
-    def simulate_episodes(self, num_episodes: int) -> SimulatorResults:
-        player_0_wins = 0
-        player_1_wins = 0
-        draws = 0
-        total_pot = 0
-        player_0_episodes_by_card = defaultdict(int)
-        player_1_episodes_by_card = defaultdict(int)
-        player_0_wins_by_card = defaultdict(int)
-        player_1_wins_by_card = defaultdict(int)
-        player_0_total_profit = 0
-        player_1_total_profit = 0
-        player_0_total_profit_by_card = defaultdict(float)
-        player_1_total_profit_by_card = defaultdict(float)
-
-        for _ in range(num_episodes):
-            # Initialize the state and histories
-            state = KuhnPokerState()
-            player_histories = [
-                KuhnPokerHistory(observations=[state.get_observation(player_id)])
-                for player_id in range(len(self.players))
-            ]
-
-            # Track the current game
-            while not state.is_terminal():
-                current_player = state.current_player()
-                current_history = player_histories[current_player]
-
-                print('state', state)
-
-                # Current player chooses an action
-                action = self.players[current_player].choose_action(current_history, current_player)
-                assert action in state.get_legal_actions()
-                print(f'Player {current_player} chooses action {action} in state {state}')
-
-
-                # Apply the action to the state
-                state.apply_action(action, current_player)
+@dataclass
+class EpisodeRecord:
+    '''
+    One finished episode, as streamed by Simulator.stream_episodes.
+    '''
+    players_hands: Tuple[int, int]
+    actions: Tuple[Optional[int], Optional[int]]  # Action of each player, None if the player did not act
+    bets: Tuple[int, int]
+    returns: Tuple[float, float]  # As given by KuhnPokerState.get_returns
+    decision_times: Tuple[Optional[float], Optional[float]]  # Seconds each player's choose_action took, None if the player did not act
 
-                # Update all players' histories
-                for player_id in range(len(self.players)):
-                    observation = state.get_observation(player_id)
-                    player_histories[player_id].observations.append(observation)
 
-            # Calculate returns and update metrics
-            returns = state.get_returns()
-            pot = state.get_pot()
-            total_pot += pot
-
-            # Update per-player metrics
-            player_0_card = state.players_hands[0]
-            player_1_card = state.players_hands[1]
-            player_0_episodes_by_card[player_0_card] += 1
-            player_1_episodes_by_card[player_1_card] += 1
-            player_0_total_profit += returns[0]
-            player_1_total_profit += returns[1]
-            player_0_total_profit_by_card[player_0_card] += returns[0]
-            player_1_total_profit_by_card[player_1_card] += returns[1]
-
-            if returns[0] > 0:
-                player_0_wins += 1
-                player_0_wins_by_card[player_0_card] += 1
-            elif returns[1] > 0:
-                player_1_wins += 1
-                player_1_wins_by_card[player_1_card] += 1
-            else:
-                draws += 1
+@dataclass
+class SimulatorTotals:
+    '''
+    Raw counters behind SimulatorResults. Totals of independent runs can be merged exactly.
+    '''
+    episodes: int = 0
+    player_0_wins: int = 0
+    player_1_wins: int = 0
+    draws: int = 0
+    total_pot: int = 0
+    player_0_episodes_by_card: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    player_1_episodes_by_card: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    player_0_wins_by_card: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    player_1_wins_by_card: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    player_0_total_profit: float = 0.0
+    player_1_total_profit: float = 0.0
+    player_0_total_profit_by_card: Dict[int, float] = field(default_factory=lambda: defaultdict(float))
+    player_1_total_profit_by_card: Dict[int, float] = field(default_factory=lambda: defaultdict(float))
+
+    def add_episode(self, state: KuhnPokerState):
+        '''
+        Adds the outcome of a finished episode.
+        '''
+        self._add_outcome(state.players_hands, state.get_returns(), state.get_pot())
+
+    def add_record(self, record: EpisodeRecord):
+        self._add_outcome(record.players_hands, record.returns, sum(record.bets))
+
+    def _add_outcome(self, players_hands: Tuple[int, ...], returns, pot: int):
+        self.episodes += 1
+        self.total_pot += pot
+
+        # Update per-player metrics
+        player_0_card = players_hands[0]
+        player_1_card = players_hands[1]
+        self.player_0_episodes_by_card[player_0_card] += 1
+        self.player_1_episodes_by_card[player_1_card] += 1
+        self.player_0_total_profit += returns[0]
+        self.player_1_total_profit += returns[1]
+        self.player_0_total_profit_by_card[player_0_card] += returns[0]
+        self.player_1_total_profit_by_card[player_1_card] += returns[1]
+
+        if returns[0] > 0:
+            self.player_0_wins += 1
+            self.player_0_wins_by_card[player_0_card] += 1
+        elif returns[1] > 0:
+            self.player_1_wins += 1
+            self.player_1_wins_by_card[player_1_card] += 1
+        else:
+            self.draws += 1
 
+    def add_batch(self, players_hands: np.ndarray, returns: np.ndarray, pots: np.ndarray):
+        '''
+        Adds the outcomes of a batch of finished episodes given as arrays: (N, 2) hands, (N, 2) returns
+        as from KuhnPokerState.get_returns and (N,) pots. Equivalent to add_episode for every episode.
+        '''
+        num_cards = len(KuhnPokerState.DECK)
+        player_0_won = returns[:, 0] > 0
+        player_1_won = ~player_0_won & (returns[:, 1] > 0)
+        self.episodes += len(pots)
+        self.total_pot += int(pots.sum())
+        self.player_0_wins += int(player_0_won.sum())
+        self.player_1_wins += int(player_1_won.sum())
+        self.draws += int((~player_0_won & ~player_1_won).sum())
+        self.player_0_total_profit += float(returns[:, 0].sum())
+        self.player_1_total_profit += float(returns[:, 1].sum())
+        for player, won, episodes_by_card, wins_by_card, profit_by_card in [
+                (0, player_0_won, self.player_0_episodes_by_card, self.player_0_wins_by_card, self.player_0_total_profit_by_card),
+                (1, player_1_won, self.player_1_episodes_by_card, self.player_1_wins_by_card, self.player_1_total_profit_by_card)]:
+            cards = players_hands[:, player]
+            episodes = np.bincount(cards, minlength=num_cards)
+            wins = np.bincount(cards[won], minlength=num_cards)
+            profits = np.bincount(cards, weights=returns[:, player], minlength=num_cards)
+            # like add_episode, only cards that were dealt get entries
+            for card in np.flatnonzero(episodes).tolist():
+                episodes_by_card[card] += int(episodes[card])
+                profit_by_card[card] += float(profits[card])
+                if wins[card] > 0:
+                    wins_by_card[card] += int(wins[card])
+
+    def merge(self, other: 'SimulatorTotals'):
+        '''
+        Adds the counters of another run to this one.
+        '''
+        self.episodes += other.episodes
+        self.player_0_wins += other.player_0_wins
+        self.player_1_wins += other.player_1_wins
+        self.draws += other.draws
+        self.total_pot += other.total_pot
+        self.player_0_total_profit += other.player_0_total_profit
+        self.player_1_total_profit += other.player_1_total_profit
+        for mine, theirs in [(self.player_0_episodes_by_card, other.player_0_episodes_by_card),
+                             (self.player_1_episodes_by_card, other.player_1_episodes_by_card),
+                             (self.player_0_wins_by_card, other.player_0_wins_by_card),
+                             (self.player_1_wins_by_card, other.player_1_wins_by_card),
+                             (self.player_0_total_profit_by_card, other.player_0_total_profit_by_card),
+                             (self.player_1_total_profit_by_card, other.player_1_total_profit_by_card)]:
+            for card, value in theirs.items():
+                mine[card] += value
+
+    def to_results(self) -> SimulatorResults:
         # Calculate conditional win rates and average profits
         player_0_conditional_winrate_by_card = {
-            card: player_0_wins_by_card[card] / player_0_episodes_by_card[card]
-            if player_0_episodes_by_card[card] > 0 else 0.0
+            card: self.player_0_wins_by_card[card] / self.player_0_episodes_by_card[card]
+            if self.player_0_episodes_by_card[card] > 0 else 0.0
             for card in KuhnPokerState.DECK
         }
         player_1_conditional_winrate_by_card = {
-            card: player_1_wins_by_card[card] / player_1_episodes_by_card[card]
-            if player_1_episodes_by_card[card] > 0 else 0.0
+            card: self.player_1_wins_by_card[card] / self.player_1_episodes_by_card[card]
+            if self.player_1_episodes_by_card[card] > 0 else 0.0
             for card in KuhnPokerState.DECK
         }
         player_0_average_profit_by_card = {
-            card: player_0_total_profit_by_card[card] / player_0_episodes_by_card[card]
-            if player_0_episodes_by_card[card] > 0 else 0.0
+            card: self.player_0_total_profit_by_card[card] / self.player_0_episodes_by_card[card]
+            if self.player_0_episodes_by_card[card] > 0 else 0.0
             for card in KuhnPokerState.DECK
         }
         player_1_average_profit_by_card = {
-            card: player_1_total_profit_by_card[card] / player_1_episodes_by_card[card]
-            if player_1_episodes_by_card[card] > 0 else 0.0
+            card: self.player_1_total_profit_by_card[card] / self.player_1_episodes_by_card[card]
+            if self.player_1_episodes_by_card[card] > 0 else 0.0
             for card in KuhnPokerState.DECK
         }
 
         return SimulatorResults(
-            player_0_wins=player_0_wins,
-            player_1_wins=player_1_wins,
-            draws=draws,
-            average_pot=total_pot / num_episodes,
-            player_0_episodes_by_card=player_0_episodes_by_card,
-            player_1_episodes_by_card=player_1_episodes_by_card,
+            player_0_wins=self.player_0_wins,
+            player_1_wins=self.player_1_wins,
+            draws=self.draws,
+            average_pot=self.total_pot / self.episodes,
+            player_0_episodes_by_card=self.player_0_episodes_by_card,
+            player_1_episodes_by_card=self.player_1_episodes_by_card,
             player_0_conditional_winrate_by_card=player_0_conditional_winrate_by_card,
             player_1_conditional_winrate_by_card=player_1_conditional_winrate_by_card,
-            player_0_average_profit=player_0_total_profit / num_episodes,
-            player_1_average_profit=player_1_total_profit / num_episodes,
+            player_0_average_profit=self.player_0_total_profit / self.episodes,
+            player_1_average_profit=self.player_1_total_profit / self.episodes,
             player_0_average_profit_by_card=player_0_average_profit_by_card,
             player_1_average_profit_by_card=player_1_average_profit_by_card,
-            total_episodes=num_episodes
+            total_episodes=self.episodes
         )
 
+
+class Simulator:
+    def __init__(self, players: List[Player], verbose: bool = False, instrument: bool = False):
+        self.players = players
+        self.verbose = verbose  # Print every state and action
+        self.instrument = instrument  # Record a SimulatorStats for every simulate_episodes call
+        self.stats = None  # SimulatorStats of the running call when instrumenting
+        self.last_stats = None  # SimulatorStats of the last finished call when instrumenting
+
+    def play_episode(self, players_hands: Optional[Tuple[int, int]] = None) -> KuhnPokerState:
+        '''
+        Plays one episode (with the given hands, or randomly dealt ones) and returns the terminal state.
+        '''
+        state, _, _ = self._play_episode(players_hands)
+        return state
+
+    def stream_episodes(self, num_episodes: int) -> Iterator[EpisodeRecord]:
+        '''
+        Plays num_episodes episodes and yields an EpisodeRecord as each one finishes, so nothing accumulates.
+        '''
+        for _ in range(num_episodes):
+            state, actions, decision_times = self._play_episode()
+            if self.stats is not None:
+                self.stats.episodes += 1
+            returns = state.get_returns()
+            yield EpisodeRecord(players_hands=state.players_hands, actions=tuple(actions), bets=state.bets,
+                                returns=(returns[0], returns[1]), decision_times=tuple(decision_times))
+
+    def _play_episode(self, players_hands: Optional[Tuple[int, int]] = None) -> Tuple[KuhnPokerState, List[Optional[int]], List[Optional[float]]]:
+        '''
+        Plays one episode and returns the terminal state with every player's action and decision time (None if the player did not act).
+        '''
+        actions = [None] * len(self.players)
+        decision_times = [None] * len(self.players)
+        # Initialize the state and histories
+        state = KuhnPokerState(players_hands)
+        player_histories = [
+            KuhnPokerHistory(observations=[state.get_observation(player_id)])
+            for player_id in range(len(self.players))
+        ]
+
+        # Track the current game
+        while not state.is_terminal():
+            current_player = state.current_player()
+            current_history = player_histories[current_player]
+
+            if self.verbose:
+                print('state', state)
+
+            # Current player chooses an action
+            start = time.perf_counter()
+            action = self.players[current_player].choose_action(current_history, current_player)
+            decision_times[current_player] = time.perf_counter() - start
+            actions[current_player] = action
+            if self.stats is not None:
+                self.stats.record_decision(current_player, decision_times[current_player])
+            assert state.is_legal_action(action)
+            if self.verbose:
+                print(f'Player {current_player} chooses action {action} in state {state}')
+
+            # Apply the action to the state
+            state = state.apply_action(action, current_player)
+
+            # Update all players' histories
+            for player_id in range(len(self.players)):
+                observation = state.get_observation(player_id)
+                player_histories[player_id] = player_histories[player_id].append(observation)
+
+        # cards are only revealed at a showdown
+        showdown = not any(state.folded)
+        for player_id, player in enumerate(self.players):
+            player.end_episode(player_histories[player_id], player_id, state.players_hands[1 - player_id] if showdown else None)
+        return state, actions, decision_times
+
+    def run_episodes(self, num_episodes: int) -> SimulatorTotals:
+        totals = SimulatorTotals()
+        for _ in range(num_episodes):
+            totals.add_episode(self.play_episode())
+        if self.stats is not None:
+            self.stats.episodes += num_episodes
+        return totals
+
+    def simulate_episodes(self, num_episodes: int, num_workers: int = 1, seed: Optional[int] = None) -> SimulatorResults:
+        '''
+        Plays num_episodes episodes and aggregates the results.
+
+        With num_workers > 1 the episodes are sharded across a process pool. Every worker gets its own copy
+        of the players and its own RNG seed derived from seed (or from the global random module if seed is None),
+        so a run is reproducible for a fixed seed and worker count. The per-worker counters are merged exactly.
+        With instrument set, the run's SimulatorStats are available as last_stats afterwards.
+        '''
+        start = time.perf_counter()
+        self.stats = SimulatorStats() if self.instrument else None
+        if num_workers <= 1:
+            if seed is not None:
+                seed_process(seed)
+            results = self.run_episodes(num_episodes).to_results()
+            self._finish_stats(start)
+            return results
+
+        if seed is None:
+            seed = random.getrandbits(64)
+        worker_seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(num_workers)]
+        shard_sizes = [num_episodes // num_workers + (1 if worker < num_episodes % num_workers else 0)
+                       for worker in range(num_workers)]
+        totals = SimulatorTotals()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(_simulate_shard, self, shard_size, worker_seed)
+                       for shard_size, worker_seed in zip(shard_sizes, worker_seeds) if shard_size > 0]
+            # merge in submission order so the result does not depend on which worker finishes first
+            for future in futures:
+                shard_totals, shard_stats = future.result()
+                totals.merge(shard_totals)
+                if self.stats is not None:
+                    self.stats.merge(shard_stats)
+        self._finish_stats(start)
+        return totals.to_results()
+
+    def _finish_stats(self, start: float):
+        if self.stats is not None:
+            self.stats.total_time = time.perf_counter() - start
+            self.last_stats = self.stats
+            self.stats = None
+
+
+def seed_process(seed: int):
+    '''
+    Seeds both the random module and NumPy's global generator of the calling process.
+    '''
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+
+def _simulate_shard(simulator: Simulator, num_episodes: int, seed: int) -> Tuple[SimulatorTotals, Optional[SimulatorStats]]:
+    '''
+    Worker entry point of Simulator.simulate_episodes: plays a shard of episodes with its own seed.
+    '''
+    seed_process(seed)
+    start = time.perf_counter()
+    totals = simulator.run_episodes(num_episodes)
+    if simulator.stats is not None:
+        simulator.stats.total_time = time.perf_counter() - start
+    return totals, simulator.stats
+
 if __name__ == '__main__':
     simulator = Simulator([RandomPlayer(), RandomPlayer()]) 
     results = simulator.simulate_episodes(10)
@@ -0,0 +1,159 @@
+import json
+import os
+from environment import *
+
+NO_ACTION = -2  # Stored in the actions column for a player who did not act (FOLD is -1)
+FORMAT_VERSION = 1
+
+# Column name -> (dtype, shape of one row). Every column is one raw little-endian file, rows back to back.
+EPISODE_COLUMNS = {
+    'players_hands': ('<i1', (2,)),
+    'actions': ('<i2', (2,)),
+    'bets': ('<i2', (2,)),
+    'returns': ('<f8', (2,)),
+    'decision_times': ('<f8', (2,)),  # Seconds, NaN for a player who did not act
+}
+
+
+def _column_path(directory: str, name: str) -> str:
+    return os.path.join(directory, name + '.bin')
+
+
+def _metadata_path(directory: str) -> str:
+    return os.path.join(directory, 'metadata.json')
+
+
+def _read_metadata(directory: str) -> Dict:
+    with open(_metadata_path(directory)) as f:
+        metadata = json.load(f)
+    if metadata['format'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported episode log format {metadata['format']}")
+    return metadata
+
+
+class EpisodeLogWriter:
+    '''
+    Appends EpisodeRecords to a columnar episode log directory in batches of batch_size rows.
+
+    Every column is an append-only raw file and metadata.json holds the schema and the number of complete rows.
+    The metadata is replaced atomically after every flushed batch, so a log interrupted mid-batch reads back as
+    the batches before it. Opening an existing log appends to it, dropping any bytes past its last complete batch.
+    Memory use is bounded by one batch.
+    '''
+    def __init__(self, directory: str, batch_size: int = 10000):
+        self.directory = directory
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(_metadata_path(directory)):
+            metadata = _read_metadata(directory)
+            if metadata['columns'] != self._schema():
+                raise ValueError(f"Episode log in {directory} has different columns")
+            self.num_episodes = metadata['num_episodes']
+        else:
+            self.num_episodes = 0
+        for name, (dtype, shape) in EPISODE_COLUMNS.items():
+            row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+            with open(_column_path(directory, name), 'ab') as f:
+                f.truncate(self.num_episodes * row_bytes)
+        self._write_metadata()
+        self.buffers = {name: np.empty((batch_size,) + shape, dtype=dtype) for name, (dtype, shape) in EPISODE_COLUMNS.items()}
+        self.buffered = 0
+
+    @staticmethod
+    def _schema() -> Dict:
+        return {name: {'dtype': dtype, 'shape': list(shape)} for name, (dtype, shape) in EPISODE_COLUMNS.items()}
+
+    def _write_metadata(self):
+        temporary_path = _metadata_path(self.directory) + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'format': FORMAT_VERSION, 'num_episodes': self.num_episodes, 'columns': self._schema()}, f, indent=2, sort_keys=True)
+        os.replace(temporary_path, _metadata_path(self.directory))
+
+    def append(self, record: EpisodeRecord):
+        row = self.buffered
+        self.buffers['players_hands'][row] = record.players_hands
+        self.buffers['actions'][row] = [NO_ACTION if action is None else action for action in record.actions]
+        self.buffers['bets'][row] = record.bets
+        self.buffers['returns'][row] = record.returns
+        self.buffers['decision_times'][row] = [np.nan if seconds is None else seconds for seconds in record.decision_times]
+        self.buffered += 1
+        if self.buffered == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffered == 0:
+            return
+        for name, buffer in self.buffers.items():
+            with open(_column_path(self.directory, name), 'ab') as f:
+                f.write(buffer[:self.buffered].tobytes())
+        self.num_episodes += self.buffered
+        self.buffered = 0
+        self._write_metadata()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self) -> 'EpisodeLogWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EpisodeLog:
+    '''
+    Read access to an episode log directory. Columns are memory-mapped, so reading does not load the log.
+    '''
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.num_episodes = _read_metadata(directory)['num_episodes']
+
+    def __len__(self) -> int:
+        return self.num_episodes
+
+    def column(self, name: str) -> np.ndarray:
+        '''
+        Read-only (num_episodes, *row shape) view of a column.
+        '''
+        dtype, shape = EPISODE_COLUMNS[name]
+        if self.num_episodes == 0:
+            return np.empty((0,) + shape, dtype=dtype)
+        return np.memmap(_column_path(self.directory, name), dtype=dtype, mode='r', shape=(self.num_episodes,) + shape)
+
+    def totals(self, chunk_size: int = 1_000_000) -> SimulatorTotals:
+        '''
+        Recomputes the SimulatorTotals of the logged episodes, chunk_size rows at a time.
+        '''
+        totals = SimulatorTotals()
+        hands, returns, bets = self.column('players_hands'), self.column('returns'), self.column('bets')
+        for start in range(0, self.num_episodes, chunk_size):
+            rows = slice(start, start + chunk_size)
+            totals.add_batch(hands[rows].astype(np.int64), np.asarray(returns[rows]), bets[rows].sum(axis=1, dtype=np.int64))
+        return totals
+
+
+def log_episodes(simulator: Simulator, num_episodes: int, directory: str, batch_size: int = 10000) -> SimulatorResults:
+    '''
+    Plays num_episodes episodes, streaming every episode into the log in directory, and returns the results of
+    this run, aggregated from the same stream. Memory use does not grow with num_episodes.
+    '''
+    start = time.perf_counter()
+    simulator.stats = SimulatorStats() if simulator.instrument else None
+    totals = SimulatorTotals()
+    with EpisodeLogWriter(directory, batch_size) as writer:
+        for record in simulator.stream_episodes(num_episodes):
+            writer.append(record)
+            totals.add_record(record)
+    simulator._finish_stats(start)
+    return totals.to_results()
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    directory = os.path.join(tempfile.mkdtemp(), 'random_vs_random')
+    results = log_episodes(Simulator([RandomPlayer(), RandomPlayer()]), 10000, directory)
+    log = EpisodeLog(directory)
+    print(f"{len(log)} episodes logged in {directory}")
+    print(log.totals().to_results() == results)
+    print(results)
@@ -0,0 +1,92 @@
+import enum
+from dataclasses import dataclass, field
+from typing import Dict
+
+
+@dataclass
+class SearchStats:
+    '''
+    What one choose_action call of an MCTS player spent its time on.
+    Phase times are in seconds and do not overlap.
+    '''
+    simulations: int = 0
+    belief_simulations: int = 0  # Of the simulations, those searching the opponent's decisions to condition the beliefs
+    expansions: int = 0
+    leaf_evaluations: int = 0
+    rollout_steps: int = 0  # Actions applied during rollouts
+    max_depth: int = 0  # Deepest simulation step reached below the root
+    tree_nodes: int = 0  # Nodes in the tree after the search
+    tree_bytes: int = 0  # Bytes held by the tree's statistics arrays after the search
+    selection_time: float = 0.0
+    expansion_time: float = 0.0
+    rollout_time: float = 0.0
+    backup_time: float = 0.0
+    total_time: float = 0.0
+
+    def merge(self, other: 'SearchStats'):
+        '''
+        Adds the counters of a search that ran alongside this one (e.g. in another worker).
+        '''
+        self.simulations += other.simulations
+        self.belief_simulations += other.belief_simulations
+        self.expansions += other.expansions
+        self.leaf_evaluations += other.leaf_evaluations
+        self.rollout_steps += other.rollout_steps
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.tree_nodes = max(self.tree_nodes, other.tree_nodes)
+        self.tree_bytes = max(self.tree_bytes, other.tree_bytes)
+        self.selection_time += other.selection_time
+        self.expansion_time += other.expansion_time
+        self.rollout_time += other.rollout_time
+        self.backup_time += other.backup_time
+
+    def simulations_per_second(self) -> float:
+        return self.simulations / self.total_time if self.total_time > 0 else 0.0
+
+
+@dataclass
+class SimulatorStats:
+    '''
+    Where the time of a Simulator run went. Times are in seconds.
+    '''
+    episodes: int = 0
+    total_time: float = 0.0
+    decisions_by_player: Dict[int, int] = field(default_factory=dict)
+    decision_time_by_player: Dict[int, float] = field(default_factory=dict)
+
+    def record_decision(self, player_id: int, seconds: float):
+        self.decisions_by_player[player_id] = self.decisions_by_player.get(player_id, 0) + 1
+        self.decision_time_by_player[player_id] = self.decision_time_by_player.get(player_id, 0.0) + seconds
+
+    def merge(self, other: 'SimulatorStats'):
+        self.episodes += other.episodes
+        self.total_time = max(self.total_time, other.total_time)  # shards run concurrently
+        for player_id, decisions in other.decisions_by_player.items():
+            self.decisions_by_player[player_id] = self.decisions_by_player.get(player_id, 0) + decisions
+        for player_id, seconds in other.decision_time_by_player.items():
+            self.decision_time_by_player[player_id] = self.decision_time_by_player.get(player_id, 0.0) + seconds
+
+    def episodes_per_second(self) -> float:
+        return self.episodes / self.total_time if self.total_time > 0 else 0.0
+
+
+class StopReason(str, enum.Enum):
+    SIMULATIONS = 'simulations'  # Ran the configured number of simulations
+    NODE_BUDGET = 'node_budget'  # Visited the configured number of nodes
+    COMPLETE = 'complete'  # Searched everything up to the depth limit
+    DEADLINE = 'deadline'  # Ran out of time
+    CONVERGED = 'converged'  # The best action stopped changing
+
+
+@dataclass
+class SearchReport:
+    '''
+    The decision of one choose_action call and the budget it used. Always recorded, unlike SearchStats.
+    '''
+    action: int
+    budget_used: int  # Simulations run (nodes visited for forward search)
+    elapsed_ms: float
+    stop_reason: StopReason
+    best_value: float = 0.0  # Value estimate of the chosen action for the acting player
+    value_gap: float = 0.0  # Margin of the chosen action over the runner-up
+    belief_simulations: int = 0  # Of budget_used, simulations searching the opponent's decisions to condition the beliefs
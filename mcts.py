@@ -1,118 +1,585 @@
 from environment import *
+from search_tree import *
+from rollouts import *
+from opponent_model import *
+import multiprocessing
+
+
+class Parallelism(str, enum.Enum):
+    ROOT = 'root'  # Independent searches per worker, root statistics combined
+    TREE = 'tree'  # Workers grow one shared tree
+
 
 class HistoryMCTSPlayer(Player):
-    def __init__(self, num_simulations: int, exploration_constant: float):
-        self.num_simulations = num_simulations
+    def __init__(self, num_simulations: Optional[int], exploration_constant: float, num_rollouts: int = 1,
+                 leaf_evaluator: str = LeafEvaluator.ROLLOUT, num_workers: int = 1,
+                 parallelism: str = Parallelism.ROOT, virtual_loss: int = 1,
+                 persist_across_episodes: bool = True, max_tree_nodes: Optional[int] = None,
+                 eviction_policy: str = EvictionPolicy.LRU, instrument: bool = False,
+                 time_budget_ms: Optional[float] = None, convergence_window: Optional[int] = None,
+                 convergence_gap: float = 0.0, convergence_check_interval: int = 10,
+                 belief_smoothing: float = 1.0, belief_sample_size: int = 64, opponent_search_simulations: int = 200,
+                 belief_search_share: float = 0.25, opponent_model: Optional[OpponentModel] = None):
+        self.num_simulations = num_simulations  # Simulations per decision (per worker), None to search until the deadline
         self.exploration_constant = exploration_constant
-        self.visit_counts = {}  # Maps (history, action) -> visit count
-        self.action_value_estimates = {}  # Maps (history, action) -> Q value estimates for each player
-        self.beliefs = {card: 1/len(KuhnPokerState.DECK) for card in KuhnPokerState.DECK}  # Maps history -> belief distribution over opponent cards
-        self.history_to_visits = {} # Maps history to visit count
+        self.num_rollouts = num_rollouts  # Random rollouts averaged per leaf evaluation
+        self.leaf_evaluator = LeafEvaluator(leaf_evaluator)  # 'rollout' samples playouts, 'exact' looks up their expected value
+        self.num_workers = num_workers  # Worker processes searching each decision if > 1
+        self.parallelism = Parallelism(parallelism)  # How the workers share the search
+        self.virtual_loss = virtual_loss  # Virtual visits held per in-flight simulation in tree-parallel search
+        self.persist_across_episodes = persist_across_episodes  # Keep the tree when a new episode starts, otherwise clear it
+        self.tree = SearchTree(max_nodes=max_tree_nodes, eviction_policy=eviction_policy)  # Node table with visit counts and Q value estimates per (history, action)
+        self.beliefs = {card: 1/len(KuhnPokerState.DECK) for card in KuhnPokerState.DECK}  # Belief distribution over opponent cards at the current decision
+        self.belief_smoothing = belief_smoothing  # Pseudo-count added to every opponent action when estimating its frequencies (Laplace smoothing)
+        self.belief_sample_size = belief_sample_size  # Opponent cards drawn from the beliefs at once
+        self.opponent_search_simulations = opponent_search_simulations  # Visits the opponent's decision nodes get before the beliefs are conditioned on them
+        self.belief_search_share = belief_search_share  # Largest share of a decision's time and simulations the opponent's decisions may get
+        self.belief_cache = {}  # Maps infoset key -> (opponent action counts, beliefs) they were computed from
+        self._sampled_cards = []  # Opponent cards drawn from the current beliefs and not used yet
+        self.opponent_model = opponent_model  # Learned across episodes and used for the beliefs instead of the tree if set
+        self.instrument = instrument  # Record a SearchStats for every choose_action call
+        self.stats = None  # SearchStats of the running search when instrumenting
+        self.last_stats = None  # SearchStats of the last finished choose_action when instrumenting
+        self.time_budget_ms = time_budget_ms  # Default wall-clock budget per decision, None for no deadline
+        self.convergence_window = convergence_window  # Stop after the best root action held for this many simulations, None to never stop early
+        self.convergence_gap = convergence_gap  # Q value margin the best root action must exceed over the runner-up to count as stable
+        self.convergence_check_interval = convergence_check_interval  # Simulations between convergence checks
+        self.last_search_report = None  # SearchReport of the last choose_action
+        self.subset_seed = random.getrandbits(64)  # Seeds per-node random choices, drawn again for every decision
+        self._executor = None  # Process pool for parallel search, created on first use
+        self._lock = None  # Guards node allocation in shared trees
+        self._manager = None  # Serves the node index of shared trees
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # process pools, locks and managers cannot be pickled; copies create their own
+        state['_executor'] = None
+        state['_lock'] = None
+        state['_manager'] = None
+        # copies draw their own opponent cards
+        state['_sampled_cards'] = []
+        return state
+
+    def close(self):
+        '''
+        Shuts down the worker processes of parallel search, if any.
+        '''
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._lock = multiprocessing.Lock()
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers,
+                                                                    initializer=_init_search_worker,
+                                                                    initargs=(self._lock,))
+        return self._executor
+
+    def _worker_seeds(self) -> List[int]:
+        return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(random.getrandbits(64)).spawn(self.num_workers)]
+
+    def node_random(self, key: InfosetKey) -> random.Random:
+        '''
+        Random generator for choices made once per node, such as the action subsets of the widening variants.
+        It is seeded by the key and subset_seed, so every worker searching a decision makes the same choices.
+        '''
+        return random.Random(hash((self.subset_seed, key)))
 
     def estimate_values(self, state: KuhnPokerState,) -> dict[int, float]:
         '''
         Estimates the values of a state using random rollouts.
+        With at least MIN_BATCHED_ROLLOUTS rollouts they are played together in closed form by the batched engine,
+        fewer are played one by one, and either way they are averaged.
+        With the exact leaf evaluator the expected value of a random rollout is looked up instead.
         '''
-        print(f'Estimating values for state:\n {state}')
-        state = state.copy()
-        while not state.is_terminal():
-            legal_actions = state.get_legal_actions()
-            print(f'The legal actions are {legal_actions} at state:\n {state}')
-            action = random.choice(legal_actions)
-            print(f'Player {state.current_player()} chooses action {action} in state {state}')
-            state.apply_action(action, state.current_player())
-            print(f'The state after the action is:\n {state}')
-        returns = state.get_returns()
-        return returns
+        if self.leaf_evaluator == LeafEvaluator.EXACT:
+            return exact_rollout_values(state)
+        if self.num_rollouts >= MIN_BATCHED_ROLLOUTS:
+            returns, steps = batched_rollout_returns(state, self.num_rollouts)
+            if self.stats is not None:
+                self.stats.rollout_steps += steps
+            return {player: float(value) / self.num_rollouts for player, value in enumerate(returns.sum(axis=0))}
+        steps = 0
+        totals = {0: 0.0, 1: 0.0}
+        for _ in range(self.num_rollouts):
+            rollout_state = state
+            while not rollout_state.is_terminal():
+                action = random.choice(rollout_state.get_legal_actions())
+                rollout_state = rollout_state.apply_action(action, rollout_state.current_player())
+                steps += 1
+            returns = rollout_state.get_returns()
+            totals[0] += returns[0]
+            totals[1] += returns[1]
+        if self.stats is not None:
+            self.stats.rollout_steps += steps
+        if self.num_rollouts == 1:
+            return returns
+        return {player: total / self.num_rollouts for player, total in totals.items()}
     
     def explore(self, history: KuhnPokerHistory) -> int:
         '''
         Selects an action to explore using UCB for the current history and current player.
         '''
-        current_player = history.get_current_player()
-        # calculate total visits to this history
-        total_visits = self.history_to_visits[history]
-        best_action = None
-        best_value = float('-inf')
-        for action in history.get_legal_actions():
-            q_value = self.action_value_estimates.get((history, action), defaultdict(float))[current_player]
-            # if action has not been visited, return it
-            if self.visit_counts.get((history, action), 0) == 0:
-                return action
-            # calculate UCB value
-            ucb_value = q_value + self.exploration_constant * math.sqrt(math.log(total_visits) / self.visit_counts[(history, action)])
-            if ucb_value > best_value:
-                best_value = ucb_value
-                best_action = action
-        assert best_action is not None, "No best action found"
-        return best_action
+        node = self.tree.get_node(history.infoset_key)
+        # unvisited actions are tried first, then UCB over all legal actions
+        return self.tree.select_ucb(node, self.tree.legal_slots[node], history.get_current_player(), self.exploration_constant)
         
 
-    def simulate(self, history: KuhnPokerHistory, state: KuhnPokerState,) -> dict[int, float]:
+    def simulate(self, history: KuhnPokerHistory, state: KuhnPokerState, depth: int = 0) -> dict[int, float]:
         '''
         Runs a Monte Carlo Tree Search simulation from the given state.
 
         Returns the simulated values of the state (one for each player).
         '''
+        stats = self.stats
         # if state is terminal, return the returns
         if state.is_terminal():
+            if stats is not None:
+                stats.max_depth = max(stats.max_depth, depth)
             return state.get_returns()
         
-        # if history has not been visited at all, return the estimated values
-        if history not in self.history_to_visits.keys():
-            self.history_to_visits[history] = 0
-            # set q values and visit counts to 0 for each action
-            for action in history.get_legal_actions():
-                self.action_value_estimates[(history, action)] = {0: 0, 1: 0}
-                self.visit_counts[(history, action)] = 0
-            
-            return self.estimate_values(state)
+        # if history has not been visited at all, expand it (q values and visit counts start at 0) and return the estimated values
+        node = self.tree.get_node(history.infoset_key)
+        if node is None:
+            if stats is None:
+                self.tree.add_node(history.infoset_key, history.get_legal_actions())
+                return self.estimate_values(state)
+            start = time.perf_counter()
+            self.tree.add_node(history.infoset_key, history.get_legal_actions())
+            expanded = time.perf_counter()
+            values = self.estimate_values(state)
+            stats.expansion_time += expanded - start
+            stats.rollout_time += time.perf_counter() - expanded
+            stats.expansions += 1
+            stats.leaf_evaluations += 1
+            stats.max_depth = max(stats.max_depth, depth)
+            return values
         
         # if state is not terminal and history has been visited, select action to explore
-        action = self.explore(history)
+        if stats is None:
+            action = self.explore(history)
+        else:
+            start = time.perf_counter()
+            action = self.explore(history)
+            stats.selection_time += time.perf_counter() - start
 
         # apply the selected action to the state
-        next_state = state.copy()
-        next_state.apply_action(action, state.current_player())
-        # simulate from the new state and new history
-        new_history = history.switch_perspective(state.current_player(), state.players_hands[state.current_player()])
-        new_history.observations.append(next_state.get_observation(next_state.current_player()))
-        new_q_values = self.simulate(new_history, next_state)
+        next_state = state.apply_action(action, state.current_player())
+        # simulate from the new state and new history (the tree keys on infoset_key, so the history's earlier observations may keep any perspective)
+        new_history = history.append(next_state.get_observation(next_state.current_player()))
+        self.tree.add_virtual_loss(node, action)
+        new_q_values = self.simulate(new_history, next_state, depth + 1)
+        self.tree.revert_virtual_loss(node, action)
         # update the q values and visit counts
-        self.visit_counts[(history, action)] += 1
-        self.history_to_visits[history] += 1
-        for player, value in new_q_values.items():
-            self.action_value_estimates[(history, action)][player] += (value - self.action_value_estimates[(history, action)][player]) / (self.visit_counts[(history, action)])
+        if stats is None:
+            self.backup(history, node, action, new_q_values)
+        else:
+            start = time.perf_counter()
+            self.backup(history, node, action, new_q_values)
+            stats.backup_time += time.perf_counter() - start
         return new_q_values
 
+    def shared_node_arrays(self) -> Dict[str, Tuple[Tuple[int, ...], type]]:
+        '''
+        Per-node arrays (name -> (row shape, dtype)) a tree shared between workers allocates for the node data of
+        variants whose node data the workers must share, see SharedSearchTree.
+        '''
+        return {}
+
+    def backup(self, history: KuhnPokerHistory, node: int, action: int, values: Dict[int, float]):
+        '''
+        Folds the simulated values through the action into the statistics of the history's node.
+        Variants keeping statistics of their own in the node data extend this.
+        '''
+        self.tree.update(node, action, values)
+
     def select_random_state(self, history: KuhnPokerHistory, beliefs: Dict[int, float]) -> KuhnPokerState:
         '''
         Chooses a random opponent card according to the beliefs and reconstructs the state from the history.
+        Cards are drawn belief_sample_size at a time; update_beliefs discards the ones left over.
         '''
-        opponent_card = random.choices(list(beliefs.keys()), weights=beliefs.values())[0] # type: ignore
+        if not self._sampled_cards:
+            self._sampled_cards = random.choices(list(beliefs.keys()), weights=list(beliefs.values()), k=self.belief_sample_size)
+        opponent_card = self._sampled_cards.pop()
         last_observation = history.get_last_observation()
         return KuhnPokerState.init_from_observation(last_observation, opponent_card)
 
-    def choose_action(self, history: KuhnPokerHistory, player_id: int) -> int:
+    def run_search(self, history: KuhnPokerHistory, num_simulations: Optional[int],
+                   deadline: Optional[float] = None) -> Tuple[int, StopReason]:
         '''
-        Runs MCTS and chooses the best action based on action value estimates.
+        Runs simulations from the history in this process until num_simulations have run, the deadline
+        (a time.perf_counter() value) has passed or the best root action has converged, whichever comes first.
+        The best action has converged once it has led the visited root actions by more than convergence_gap for
+        convergence_window simulations. At least one simulation is always run.
+
+        Returns the number of simulations run and why the search stopped.
         '''
-        for _ in range(self.num_simulations):
+        simulations = 0
+        stop_reason = StopReason.SIMULATIONS
+        stable_action, stable_since = None, 0
+        while num_simulations is None or simulations < num_simulations:
+            self.tree.tick()
             # select random state according to beliefs
             state = self.select_random_state(history, self.beliefs)
             # simulate from the selected state
-            returns = self.simulate(history, state)
-        
-        # get best action for the current history by returning action with highest q value
-        best_action = None
-        best_value = float('-inf')
-        for action in history.get_legal_actions():
-            q_value = self.action_value_estimates.get((history, action), defaultdict(float))[player_id]
-            if q_value > best_value:
-                best_value = q_value
-                best_action = action
-        assert best_action is not None, "No best action found"
-        return best_action
+            self.simulate(history, state)
+            simulations += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                stop_reason = StopReason.DEADLINE
+                break
+            if self.convergence_window is not None and simulations % self.convergence_check_interval == 0:
+                legal_actions, visits, values = self.root_statistics(history)
+                # unvisited actions have no estimate yet, so they are neither the best action nor the runner-up
+                values = np.where((visits > 0)[:, None], values, -np.inf)
+                action, _, value_gap = root_decision(legal_actions, values, history.get_current_player())
+                if action != stable_action or not value_gap > self.convergence_gap:
+                    stable_action, stable_since = action, simulations
+                elif simulations - stable_since >= self.convergence_window:
+                    stop_reason = StopReason.CONVERGED
+                    break
+        if self.stats is not None:
+            self.stats.simulations += simulations
+        return simulations, stop_reason
+
+    def root_statistics(self, history: KuhnPokerHistory) -> Tuple[Tuple[int, ...], np.ndarray, np.ndarray]:
+        '''
+        Returns the legal actions of the history with their visit counts and Q values (one column per player).
+        '''
+        legal_actions = history.get_legal_actions()
+        visits, values = self.tree.get_action_statistics(self.tree.get_node(history.infoset_key), legal_actions)
+        return legal_actions, visits, values
+
+    def root_parallel_search(self, history: KuhnPokerHistory, num_simulations: Optional[int],
+                             deadline: Optional[float] = None) -> Tuple[Tuple[int, ...], np.ndarray, np.ndarray, int, StopReason]:
+        '''
+        Searches the history in num_workers processes with independent seeds, each running num_simulations
+        simulations on its own copy of the player. The root statistics are combined: visit counts are summed
+        and Q values are averaged weighted by visits. Per-node random choices are seeded by the key (see node_random),
+        so the workers of the fixed-width variants search the same action subsets.
+
+        Also returns the simulations run by all workers together and why the search stopped.
+        '''
+        executor = self._get_executor()
+        time_budget = _remaining_time(deadline)
+        futures = [executor.submit(_root_search_worker, self, history, num_simulations, seed, time_budget)
+                   for seed in self._worker_seeds()]
+        legal_actions = history.get_legal_actions()
+        total_visits = np.zeros(len(legal_actions), dtype=np.int64)
+        weighted_values = np.zeros((len(legal_actions), NUM_PLAYERS))
+        excluded = np.ones((len(legal_actions), NUM_PLAYERS), dtype=bool)  # Masked with -inf by every worker
+        total_simulations = 0
+        stop_reasons = []
+        for future in futures:
+            visits, values, stats, simulations, stop_reason = future.result()
+            if self.stats is not None:
+                self.stats.merge(stats)
+            # a worker masks only actions it never visited, so their values carry no weight
+            masked = np.isneginf(values)
+            excluded &= masked
+            total_visits += visits
+            weighted_values += visits[:, None] * np.where(masked, 0.0, values)
+            total_simulations += simulations
+            stop_reasons.append(stop_reason)
+        values = np.divide(weighted_values, total_visits[:, None], out=np.zeros_like(weighted_values),
+                           where=total_visits[:, None] > 0)
+        values[excluded] = -np.inf
+        return legal_actions, total_visits, values, total_simulations, combine_stop_reasons(stop_reasons)
+
+    def tree_parallel_search(self, history: KuhnPokerHistory, num_simulations: Optional[int],
+                             deadline: Optional[float] = None) -> Tuple[Tuple[int, ...], np.ndarray, np.ndarray, int, StopReason]:
+        '''
+        Grows one tree from the history in num_workers processes, each running num_simulations simulations.
+        The tree lives in shared memory for the duration of the decision and is freed afterwards;
+        the player's own tree is not modified. Per-node random choices are seeded by the key (see node_random),
+        so all workers search the same action subsets of the fixed-width variants.
+
+        Also returns the simulations run by all workers together and why the search stopped.
+        '''
+        if num_simulations is None:
+            raise ValueError('Tree-parallel search sizes its shared tree from num_simulations, which must be set')
+        executor = self._get_executor()
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        # every simulation expands at most one node
+        tree = SharedSearchTree(self.num_workers * num_simulations + 1, self._manager.dict(), self._lock,
+                                virtual_loss=self.virtual_loss, node_arrays=self.shared_node_arrays())
+        try:
+            time_budget = _remaining_time(deadline)
+            worker = self._tree_search_worker_copy()
+            futures = [executor.submit(_tree_search_worker, worker, history, num_simulations, seed, tree.handle(), time_budget)
+                       for seed in self._worker_seeds()]
+            total_simulations = 0
+            stop_reasons = []
+            for future in futures:
+                stats, simulations, stop_reason = future.result()
+                if self.stats is not None:
+                    self.stats.merge(stats)
+                total_simulations += simulations
+                stop_reasons.append(stop_reason)
+            # read the root through root_statistics, so variants restricting the root choice apply here as well
+            own_tree, self.tree = self.tree, tree
+            try:
+                legal_actions, visits, values = self.root_statistics(history)
+            finally:
+                self.tree = own_tree
+            return legal_actions, visits, values, total_simulations, combine_stop_reasons(stop_reasons)
+        finally:
+            tree.unlink()
+
+    def _tree_search_worker_copy(self) -> 'HistoryMCTSPlayer':
+        '''
+        Copy of the player sent to tree-parallel workers. It leaves out the player's own tree, which the workers
+        replace with the shared one, and the belief state, which only the deciding process uses, so the payload does
+        not grow with the persisted statistics.
+        '''
+        worker = object.__new__(type(self))
+        worker.__dict__.update(self.__getstate__())
+        worker.tree = None
+        worker.belief_cache = {}
+        worker.opponent_model = None
+        return worker
+
+    def _record_tree_size(self):
+        if self.stats is not None:
+            self.stats.tree_nodes = len(self.tree)
+            self.stats.tree_bytes = self.tree.nbytes
+
+    def opponent_action_counts(self, history: KuhnPokerHistory, opponent_card: int) -> Tuple[Tuple[int, int, int], ...]:
+        '''
+        For every decision the opponent made along the history: how often the tree took the observed action and
+        any action at the opponent's node for that decision, had it held opponent_card, and how many actions it had.
+        '''
+        counts = []
+        for decision_history, player, action in history.decisions():
+            if player == history.get_last_observation().player_index:
+                continue
+            node = self.tree.get_node(InfosetKey(opponent_card, player, decision_history.actions))
+            num_actions = len(decision_history.get_legal_actions())
+            if node is None:
+                counts.append((0, 0, num_actions))
+            else:
+                counts.append((self.tree.get_visits(node, action), self.tree.get_total_visits(node), num_actions))
+        return tuple(counts)
+
+    def search_opponent_decisions(self, history: KuhnPokerHistory, deadline: Optional[float] = None,
+                                  max_simulations: Optional[int] = None) -> int:
+        '''
+        Searches every decision the opponent made along the history from the opponent's side, once for each card it
+        may hold, until its node has opponent_search_simulations visits, max_simulations have run in total or the
+        deadline has passed. The player's own
+        search starts below the opponent's decisions and never reaches these nodes. The opponent does not know the
+        player's card, so it is drawn uniformly for each simulation.
+
+        Returns the number of simulations run, which count towards the decision's budget.
+        '''
+        player_index = history.get_last_observation().player_index
+        own_card = history.get_last_observation().player_hand
+        simulations = 0
+        for decision_history, player, _ in history.decisions():
+            if player == player_index:
+                continue
+            for card in KuhnPokerState.DECK:
+                if card == own_card:
+                    continue
+                opponent_history = decision_history.switch_perspective(player, card)
+                node = self.tree.get_node(opponent_history.infoset_key)
+                visits = self.tree.get_total_visits(node) if node is not None else 0
+                player_cards = [other for other in KuhnPokerState.DECK if other != card]
+                for _ in range(self.opponent_search_simulations - visits):
+                    if max_simulations is not None and simulations >= max_simulations:
+                        break
+                    if deadline is not None and time.perf_counter() >= deadline:
+                        break
+                    self.tree.tick()
+                    state = KuhnPokerState.init_from_observation(opponent_history.get_last_observation(), random.choice(player_cards))
+                    self.simulate(opponent_history, state)
+                    simulations += 1
+        if self.stats is not None:
+            self.stats.simulations += simulations
+            self.stats.belief_simulations += simulations
+        return simulations
+
+    def update_beliefs(self, history: KuhnPokerHistory, deadline: Optional[float] = None,
+                       max_simulations: Optional[int] = None) -> int:
+        '''
+        Conditions the beliefs over the opponent card on the history with Bayes' rule.
+
+        The player's own card is excluded. Every other card is weighted by the likelihood of the opponent's observed
+        actions, estimated from the visit frequencies at the opponent's nodes in the tree with belief_smoothing added
+        to every action count. Those nodes are searched first (see search_opponent_decisions), so the likelihoods are
+        those of an opponent searching like this player, not of the actual opponent; an opponent_model learns the
+        latter. Beliefs are cached per history and only recomputed when those counts have changed.
+
+        With an opponent_model, its posterior is used instead.
+
+        Returns the number of simulations spent searching the opponent's decisions, at most max_simulations and
+        before the deadline.
+        '''
+        if self.opponent_model is not None:
+            beliefs = self.opponent_model.posterior(history)
+            if beliefs != self.beliefs:
+                self._sampled_cards = []
+            self.beliefs = beliefs
+            return 0
+        simulations = self.search_opponent_decisions(history, deadline, max_simulations)
+        observation = history.get_last_observation()
+        opponent_cards = [card for card in KuhnPokerState.DECK if card != observation.player_hand]
+        counts = tuple(self.opponent_action_counts(history, card) for card in opponent_cards)
+        cached = self.belief_cache.get(history.infoset_key)
+        if cached is not None and cached[0] == counts:
+            beliefs = cached[1]
+        else:
+            likelihoods = [math.prod((action_visits + self.belief_smoothing) / (total_visits + self.belief_smoothing * num_actions)
+                                     for action_visits, total_visits, num_actions in card_counts)
+                           for card_counts in counts]
+            total = sum(likelihoods)
+            beliefs = {card: likelihood / total for card, likelihood in zip(opponent_cards, likelihoods)}
+            self.belief_cache[history.infoset_key] = (counts, beliefs)
+        if beliefs != self.beliefs:
+            self._sampled_cards = []
+        self.beliefs = beliefs
+        return simulations
+
+    def end_episode(self, history: KuhnPokerHistory, player_id: int, opponent_card: Optional[int]):
+        '''
+        The tree is keyed by infoset, so with persist_across_episodes it is kept and infosets seen in earlier episodes
+        start warm; otherwise it is cleared. Each player acts at most once per episode, so there is no subtree to carry
+        over between decisions within an episode.
+        '''
+        if not self.persist_across_episodes:
+            self.tree.clear()
+        if self.opponent_model is not None:
+            self.opponent_model.observe(history, opponent_card)
+
+    def choose_action(self, history: KuhnPokerHistory, player_id: int, deadline_ms: Optional[float] = None) -> int:
+        '''
+        Runs MCTS and chooses the best action based on action value estimates.
+
+        The search stops after num_simulations simulations, after deadline_ms milliseconds (time_budget_ms if not given)
+        or once the best action has converged, whichever comes first. The search of the opponent's decisions that
+        conditions the beliefs gets at most belief_search_share of the time and of the simulations, so the rest is
+        left for the decision itself; its simulations count towards num_simulations (evenly split across workers).
+        The outcome is recorded in last_search_report.
+        '''
+        start = time.perf_counter()
+        if deadline_ms is None:
+            deadline_ms = self.time_budget_ms
+        if self.num_simulations is None and deadline_ms is None:
+            raise ValueError('Without num_simulations the search needs a time budget')
+        deadline = start + deadline_ms / 1000 if deadline_ms is not None else None
+        self.subset_seed = random.getrandbits(64)
+        self.stats = SearchStats() if self.instrument else None
+        belief_deadline = start + self.belief_search_share * deadline_ms / 1000 if deadline_ms is not None else None
+        belief_budget = int(self.belief_search_share * self.num_simulations) if self.num_simulations is not None else None
+        belief_simulations = self.update_beliefs(history, belief_deadline, belief_budget)
+        num_simulations = self.num_simulations
+        if num_simulations is not None:
+            # every worker gives up its share of the belief simulations, rounded up so they stay within the budget
+            num_simulations = max(1, num_simulations + belief_simulations // -self.num_workers)
+
+        if self.num_workers > 1 and self.parallelism == Parallelism.TREE:
+            legal_actions, visits, values, simulations, stop_reason = self.tree_parallel_search(history, num_simulations, deadline)
+        elif self.num_workers > 1:
+            legal_actions, visits, values, simulations, stop_reason = self.root_parallel_search(history, num_simulations, deadline)
+        else:
+            simulations, stop_reason = self.run_search(history, num_simulations, deadline)
+            self._record_tree_size()
+            legal_actions, visits, values = self.root_statistics(history)
+
+        if self.stats is not None:
+            self.stats.total_time = time.perf_counter() - start
+            self.last_stats = self.stats
+            self.stats = None
+
+        # get best action for the current history by returning action with highest q value (first one on ties)
+        assert len(legal_actions) > 0, "No best action found"
+        action, best_value, value_gap = root_decision(legal_actions, values, player_id)
+        self.last_search_report = SearchReport(action=action, budget_used=simulations + belief_simulations,
+                                               elapsed_ms=(time.perf_counter() - start) * 1000,
+                                               stop_reason=stop_reason, best_value=best_value, value_gap=value_gap,
+                                               belief_simulations=belief_simulations)
+        return action
+
+
+def root_decision(legal_actions: Tuple[int, ...], values: np.ndarray, player_id: int) -> Tuple[int, float, float]:
+    '''
+    Returns the action with the highest Q value for the player (first one on ties), its Q value
+    and its margin over the best other action (0 if it is the only action not masked with -inf).
+    '''
+    player_values = values[:, player_id]
+    best = int(np.argmax(player_values))
+    best_value = float(player_values[best])
+    other_values = np.delete(player_values, best)
+    other_values = other_values[other_values > -np.inf]
+    if len(other_values) == 0:
+        return legal_actions[best], best_value, 0.0
+    return legal_actions[best], best_value, best_value - float(other_values.max())
+
+
+def combine_stop_reasons(stop_reasons: List[StopReason]) -> StopReason:
+    '''
+    Why a search split across workers stopped: the deadline if any worker hit it,
+    convergence if every worker converged, the simulation budget otherwise.
+    '''
+    if StopReason.DEADLINE in stop_reasons:
+        return StopReason.DEADLINE
+    if all(stop_reason == StopReason.CONVERGED for stop_reason in stop_reasons):
+        return StopReason.CONVERGED
+    return StopReason.SIMULATIONS
+
+
+def _remaining_time(deadline: Optional[float]) -> Optional[float]:
+    # perf_counter values are not comparable across processes, so workers get the remaining seconds instead
+    return None if deadline is None else deadline - time.perf_counter()
+
+
+def _worker_deadline(time_budget: Optional[float]) -> Optional[float]:
+    return None if time_budget is None else time.perf_counter() + time_budget
+
+
+_worker_lock = None  # Node allocation lock of shared trees, set in every worker process
+
+
+def _init_search_worker(lock):
+    global _worker_lock
+    _worker_lock = lock
+
+
+def _root_search_worker(player: HistoryMCTSPlayer, history: KuhnPokerHistory, num_simulations: Optional[int], seed: int,
+                        time_budget: Optional[float]) -> Tuple[np.ndarray, np.ndarray, Optional[SearchStats], int, StopReason]:
+    '''
+    Worker entry point of root-parallel search: searches the history with its own seed for at most num_simulations
+    simulations and time_budget seconds and returns the root statistics, the number of simulations and why it stopped.
+    '''
+    deadline = _worker_deadline(time_budget)
+    seed_process(seed)
+    player.stats = SearchStats() if player.instrument else None
+    simulations, stop_reason = player.run_search(history, num_simulations, deadline)
+    player._record_tree_size()
+    _, visits, values = player.root_statistics(history)
+    return visits, values, player.stats, simulations, stop_reason
+
+
+def _tree_search_worker(player: HistoryMCTSPlayer, history: KuhnPokerHistory, num_simulations: Optional[int], seed: int,
+                        tree_handle: Tuple, time_budget: Optional[float]) -> Tuple[Optional[SearchStats], int, StopReason]:
+    '''
+    Worker entry point of tree-parallel search: runs at most num_simulations simulations on the shared tree with its
+    own seed for at most time_budget seconds. Returns the number of simulations and why it stopped.
+    '''
+    deadline = _worker_deadline(time_budget)
+    seed_process(seed)
+    player.stats = SearchStats() if player.instrument else None
+    player.tree = SharedSearchTree.attach(tree_handle, _worker_lock)
+    try:
+        simulations, stop_reason = player.run_search(history, num_simulations, deadline)
+        player._record_tree_size()
+    finally:
+        player.tree.close()
+    return player.stats, simulations, stop_reason
 
 if __name__ == '__main__':
     # Now we can simulate the game with the MCTS player
@@ -2,48 +2,37 @@ from environment import *
 from mcts import *
 
 class HumanCraftedMCTSPlayer(HistoryMCTSPlayer):
-    def __init__(self, num_simulations: int, exploration_constant: float, fixed_width: int = 3):
-        super().__init__(num_simulations, exploration_constant)
+    def __init__(self, num_simulations: int, exploration_constant: float, fixed_width: int = 3, **kwargs):
+        super().__init__(num_simulations, exploration_constant, **kwargs)
         self.fixed_width = fixed_width
-        self.history_to_actions = {}  # Maps history to sampled legal actions
 
     def get_sampled_actions(self, history: KuhnPokerHistory) -> list[int]:
         """
         Returns a consistent subset of legal actions for a given history.
-        If the history is encountered for the first time, sample and store the actions.
+        If the history is encountered for the first time, select the actions and store them with its tree node.
         """
-        if history not in self.history_to_actions:
+        node = self.tree.get_node(history.infoset_key)
+        sampled_actions = self.tree.get_node_data(node)
+        if sampled_actions is None:
             legal_actions = history.get_legal_actions()
             if len(legal_actions) > self.fixed_width:
                 # we will sort the actions and take actions at regular intervals starting from the first action
-                legal_actions.sort()
-                self.history_to_actions[history] = [legal_actions[i] for i in range(0, len(legal_actions), len(legal_actions)//self.fixed_width)]
+                legal_actions = sorted(legal_actions)
+                sampled_actions = [legal_actions[i] for i in range(0, len(legal_actions), len(legal_actions)//self.fixed_width)]
             else:
-                self.history_to_actions[history] = legal_actions
-        return self.history_to_actions[history]
+                sampled_actions = legal_actions
+            self.tree.set_node_data(node, sampled_actions)
+        return sampled_actions
 
     def explore(self, history: KuhnPokerHistory) -> int:
         """
         Selects an action to explore using UCB with a fixed-width constraint for the current history and player.
         """
-        current_player = history.get_current_player()
-        total_visits = sum(self.visit_counts.get((history, a), 0) for a in history.get_legal_actions())
+        node = self.tree.get_node(history.infoset_key)
         legal_actions = self.get_sampled_actions(history)
-
-        best_action = None
-        best_value = float('-inf')
-        for action in legal_actions:
-            q_value = self.action_value_estimates.get((history, action), defaultdict(float))[current_player]
-            if self.visit_counts.get((history, action), 0) == 0:
-                return action
-            ucb_value = q_value + self.exploration_constant * math.sqrt(
-                math.log(total_visits + 1) / (self.visit_counts[(history, action)] + 1)
-            )
-            if ucb_value > best_value:
-                best_value = ucb_value
-                best_action = action
-        assert best_action is not None, "No best action found"
-        return best_action
+        assert len(legal_actions) > 0, "No best action found"
+        return self.tree.select_ucb(node, action_slots(legal_actions), history.get_current_player(),
+                                    self.exploration_constant, offset=1)
 
 if __name__ == '__main__':
     # Test the FixedWidthMCTSPlayer
@@ -2,46 +2,35 @@ from environment import *
 from mcts import *
 
 class ProgressiveWideningMCTSPlayer(HistoryMCTSPlayer):
-    def __init__(self, num_simulations: int, exploration_constant: float, theta_1: float, theta_2: float):
-        super().__init__(num_simulations, exploration_constant)
+    def __init__(self, num_simulations: int, exploration_constant: float, theta_1: float, theta_2: float, **kwargs):
+        super().__init__(num_simulations, exploration_constant, **kwargs)
         self.theta_1 = theta_1
         self.theta_2 = theta_2
-        self.history_to_actions = {}  # Maps history to shuffled legal actions
 
     def get_progressively_widened_actions(self, history: KuhnPokerHistory) -> list[int]:
         """
         Returns the subset of legal actions based on progressive widening for the given history.
         """
-        if history not in self.history_to_actions:
-            self.history_to_actions[history] = random.sample(history.get_legal_actions(), len(history.get_legal_actions()))
+        node = self.tree.get_node(history.infoset_key)
+        shuffled_actions = self.tree.get_node_data(node)  # legal actions in the order they are added
+        if shuffled_actions is None:
+            shuffled_actions = self.node_random(history.infoset_key).sample(history.get_legal_actions(), len(history.get_legal_actions()))
+            self.tree.set_node_data(node, shuffled_actions)
 
-        total_visits = self.history_to_visits[history]
+        total_visits = self.tree.get_total_visits(node)
         max_actions = int(self.theta_1 * (total_visits ** self.theta_2))
-        legal_actions = self.history_to_actions[history][:max(1, min(max_actions, len(self.history_to_actions[history])))]
+        legal_actions = shuffled_actions[:max(1, min(max_actions, len(shuffled_actions)))]
         return legal_actions
 
     def explore(self, history: KuhnPokerHistory) -> int:
         """
         Selects an action to explore using UCB with progressive widening.
         """
-        current_player = history.get_current_player()
-        total_visits = self.history_to_visits[history]
+        node = self.tree.get_node(history.infoset_key)
         legal_actions = self.get_progressively_widened_actions(history)
-
-        best_action = None
-        best_value = float('-inf')
-        for action in legal_actions:
-            q_value = self.action_value_estimates.get((history, action), defaultdict(float))[current_player]
-            if self.visit_counts.get((history, action), 0) == 0:
-                return action
-            ucb_value = q_value + self.exploration_constant * math.sqrt(
-                math.log(total_visits + 1) / (self.visit_counts[(history, action)] + 1)
-            )
-            if ucb_value > best_value:
-                best_value = ucb_value
-                best_action = action
-        assert best_action is not None, "No best action found"
-        return best_action
+        assert len(legal_actions) > 0, "No best action found"
+        return self.tree.select_ucb(node, action_slots(legal_actions), history.get_current_player(),
+                                    self.exploration_constant, offset=1)
 
 
 if __name__ == '__main__':
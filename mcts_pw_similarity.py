@@ -1,82 +1,227 @@
 from environment import *
 from mcts import *
 
+SLOT_ACTIONS = np.arange(NUM_ACTION_SLOTS) + int(ActionType.FOLD)  # Maps action slot -> action (a check is a bet of 0)
+
+
+def bet_size_kernel(bandwidth: float) -> np.ndarray:
+    '''
+    Gaussian similarity of every pair of action slots by bet size. FOLD is only similar to itself.
+    '''
+    kernel = np.exp(-0.5 * ((SLOT_ACTIONS[:, None] - SLOT_ACTIONS[None, :]) / bandwidth) ** 2)
+    fold = action_slot(ActionType.FOLD)
+    kernel[fold, :] = 0.0
+    kernel[:, fold] = 0.0
+    kernel[fold, fold] = 1.0
+    return kernel
+
+
+class BetValueModel:
+    '''
+    Kernel regression (Nadaraya-Watson) of one node's Q values over bet sizes, maintained incrementally.
+
+    Every backup adds the kernel row of its action to the smoothed visit counts and, weighted by the value for
+    the acting player, to the smoothed value sums. The smoothed Q value of any bet size is then one division,
+    so nearby bets share what was learned about each other at the cost of one vector addition per backup.
+
+    The model's state lives in one row of each of ROW_ARRAYS. In a shared tree these are the node's rows of the
+    shared per-node arrays, so all workers grow one model, and lock guards adding actions to it.
+    '''
+    ROW_ARRAYS = {
+        'smoothed_visits': ((NUM_ACTION_SLOTS,), np.float64),
+        'smoothed_values': ((NUM_ACTION_SLOTS,), np.float64),
+        'added_order': ((NUM_ACTION_SLOTS,), np.int64),  # Slots of the added actions in the order they were added
+        'num_added': ((1,), np.int64),  # Valid entries of added_order
+    }
+
+    def __init__(self, legal_actions: Tuple[int, ...], initial_actions: List[int],
+                 rows: Optional[Dict[str, np.ndarray]] = None, lock=None):
+        if rows is None:
+            rows = {name: np.zeros(shape, dtype=dtype) for name, (shape, dtype) in BetValueModel.ROW_ARRAYS.items()}
+        self.legal = np.zeros(NUM_ACTION_SLOTS, dtype=bool)  # Legal action slots
+        self.legal[action_slots(legal_actions)] = True
+        self.smoothed_visits = rows['smoothed_visits']
+        self.smoothed_values = rows['smoothed_values']
+        self.added_order = rows['added_order']
+        self.num_added = rows['num_added']
+        self.lock = lock
+        self._cached_count = -1  # num_added when _added_slots and _added_actions were last read from the rows
+        self._added_slots = None
+        self._added_actions = None
+        if self.lock is None:
+            self._add_initial(initial_actions)
+        else:
+            with self.lock:
+                self._add_initial(initial_actions)
+
+    def _add_initial(self, initial_actions: List[int]):
+        # another worker sharing the rows may have set the model up already
+        if self.num_added[0] == 0:
+            for action in initial_actions:
+                self._add(action)
+
+    def _refresh(self):
+        # added_order only grows at the end, so the count tells whether the cached copies are current
+        count = int(self.num_added[0])
+        if count != self._cached_count:
+            self._added_slots = self.added_order[:count].copy()
+            self._added_actions = (self._added_slots + int(ActionType.FOLD)).tolist()
+            self._cached_count = count
+
+    @property
+    def added_slots(self) -> np.ndarray:
+        self._refresh()
+        return self._added_slots
+
+    @property
+    def added_actions(self) -> List[int]:
+        '''
+        Actions available to selection, in the order they were added.
+        '''
+        self._refresh()
+        return self._added_actions
+
+    def add(self, action: int):
+        if self.lock is None:
+            self._add(action)
+        else:
+            with self.lock:
+                self._add(action)
+
+    def _add(self, action: int):
+        slot = action_slot(action)
+        num_added = int(self.num_added[0])
+        if slot in self.added_order[:num_added]:
+            return
+        self.added_order[num_added] = slot
+        self.num_added[0] = num_added + 1
+
+    def update(self, kernel_row: np.ndarray, value: float):
+        self.smoothed_visits += kernel_row
+        self.smoothed_values += kernel_row * value
+
+    def q_values(self, slots: np.ndarray) -> np.ndarray:
+        '''
+        Smoothed Q values of the slots, 0 where nothing nearby was visited.
+        '''
+        visits = self.smoothed_visits[slots]
+        return np.divide(self.smoothed_values[slots], visits, out=np.zeros(len(slots)), where=visits > 0)
+
+    def ucb_values(self, slots: np.ndarray, total_visits: int, exploration_constant: float) -> np.ndarray:
+        '''
+        Smoothed Q + c * sqrt(log(N + 1) / (smoothed n + 1)) of the slots.
+        '''
+        return self.q_values(slots) + exploration_constant * np.sqrt(math.log(total_visits + 1) / (self.smoothed_visits[slots] + 1))
+
+    def select(self, total_visits: int, exploration_constant: float) -> int:
+        '''
+        The added action with the highest smoothed UCB value (the first one on ties).
+        '''
+        slots = self.added_slots
+        ucb_values = self.ucb_values(slots, total_visits, exploration_constant)
+        return int(slots[ucb_values.argmax()]) + int(ActionType.FOLD)
+
+    def add_best_remaining(self, total_visits: int, exploration_constant: float) -> Optional[int]:
+        '''
+        Adds the legal action not added yet with the highest smoothed UCB value and returns it, None if all are added.
+        '''
+        remaining = self.legal.copy()
+        remaining[self.added_slots] = False
+        slots = np.flatnonzero(remaining)
+        if len(slots) == 0:
+            return None
+        action = int(slots[self.ucb_values(slots, total_visits, exploration_constant).argmax()]) + int(ActionType.FOLD)
+        self.add(action)
+        return action
+
+
 class PWSimilarityMCTSPlayer(HistoryMCTSPlayer):
-    def __init__(self, num_simulations: int, exploration_constant: float, theta_1: float, theta_2: float):
-        super().__init__(num_simulations, exploration_constant)
+    def __init__(self, num_simulations: int, exploration_constant: float, theta_1: float, theta_2: float,
+                 kernel_bandwidth: float = 5.0, **kwargs):
+        super().__init__(num_simulations, exploration_constant, **kwargs)
         self.theta_1 = theta_1
         self.theta_2 = theta_2
-        self.history_to_actions = {}  # Maps history to actions already added
+        self.kernel_bandwidth = kernel_bandwidth  # Bet sizes within about this distance share their value estimates
+        self.kernel = bet_size_kernel(kernel_bandwidth)
+
+    def get_value_model(self, history: KuhnPokerHistory) -> BetValueModel:
+        node = self.tree.get_node(history.infoset_key)
+        model = self.tree.get_node_data(node)
+        if model is None:
+            # start from the highest and lowest legal actions
+            legal_actions = history.get_legal_actions()
+            initial_actions = [min(legal_actions), max(legal_actions)]
+            rows = self.tree.shared_node_rows(node)
+            if rows is None:
+                model = BetValueModel(legal_actions, initial_actions)
+            else:
+                # workers growing a shared tree share the model through the node's rows
+                model = BetValueModel(legal_actions, initial_actions, rows, self.tree.lock)
+            self.tree.set_node_data(node, model)
+        return model
+
+    def shared_node_arrays(self) -> Dict[str, Tuple[Tuple[int, ...], type]]:
+        return BetValueModel.ROW_ARRAYS
 
     def get_progressively_widened_actions(self, history: KuhnPokerHistory) -> list[int]:
         """
         Returns the subset of legal actions based on progressive widening for the given history.
         """
-        if history not in self.history_to_actions:
-            # add highest and lowest actions from the legal actions
-            self.history_to_actions[history] = [min(history.get_legal_actions()), max(history.get_legal_actions())]
-
-        total_visits = self.history_to_visits[history]
+        model = self.get_value_model(history)
+        total_visits = self.tree.get_total_visits(self.tree.get_node(history.infoset_key))
         max_actions = int(self.theta_1 * (total_visits ** self.theta_2))
-        
-        if len(self.history_to_actions[history]) + 1 <= max_actions:
+
+        if len(model.added_actions) + 1 <= max_actions:
             # time to add a new action
-            legal_actions = history.get_legal_actions()
-            new_action = self.add_new_action(self.history_to_actions[history], history, legal_actions)
-            self.history_to_actions[history].append(new_action)
+            self.add_new_action(model, total_visits)
+
+        return model.added_actions
 
-        return self.history_to_actions[history]
-    
-    def add_new_action(self, already_added_actions: list[int], history: KuhnPokerHistory, legal_actions: list[int]) -> int:
+    def add_new_action(self, model: BetValueModel, total_visits: int) -> Optional[int]:
         '''
-        First sort the legal actions.
-        First find index of action in already_added_actions with the highest Q-value. 
-        The find two closest actions to this action in the already_added_actions.
-        Then find the action in legal_actions that is closest to the average of the two actions in already_added_actions.
+        Adds the legal action whose kernel-smoothed UCB value is highest: a bet close to well-performing added bets,
+        or one far from every visited bet, which gets the full exploration bonus.
         '''
-        legal_actions.sort()
-        q_values = [self.action_value_estimates.get((history, action), defaultdict(float))[history.get_current_player()] for action in already_added_actions]
-        max_q_value_index = q_values.index(max(q_values))
-        if max_q_value_index == 0:
-            closest_actions = already_added_actions[:2]
-        elif max_q_value_index == len(already_added_actions) - 1:
-            closest_actions = already_added_actions[-2:]
-        else:
-            closest_actions = already_added_actions[max_q_value_index - 1: max_q_value_index + 2]
-        average = sum(closest_actions) / 2
-        best_action = None
-        best_distance = float('inf')
-        for action in legal_actions:
-            distance = abs(action - average)
-            if distance < best_distance:
-                best_distance = distance
-                best_action = action
-        assert best_action is not None, "No best action found"
-        return best_action
-
+        return model.add_best_remaining(total_visits, self.exploration_constant)
 
     def explore(self, history: KuhnPokerHistory) -> int:
         """
-        Selects an action to explore using UCB with progressive widening.
+        Selects an action to explore using UCB over kernel-smoothed values with progressive widening.
+        Added actions that were never visited themselves are tried first, so every added action has a Q value of its own.
         """
-        current_player = history.get_current_player()
-        total_visits = self.history_to_visits[history]
+        node = self.tree.get_node(history.infoset_key)
         legal_actions = self.get_progressively_widened_actions(history)
+        assert len(legal_actions) > 0, "No best action found"
+        model = self.tree.get_node_data(node)
+        # read the added slots once, another worker sharing the model may add to them meanwhile
+        added_slots = model.added_slots
+        visits, _ = self.tree.slot_statistics(node, added_slots, history.get_current_player())
+        least_visited = visits.argmin()
+        if visits[least_visited] == 0:
+            return int(added_slots[least_visited]) + int(ActionType.FOLD)
+        return model.select(self.tree.get_total_visits(node), self.exploration_constant)
+
+    def root_statistics(self, history: KuhnPokerHistory) -> Tuple[Tuple[int, ...], np.ndarray, np.ndarray]:
+        '''
+        As for the other variants, but for the acting player only the added actions are candidates: their Q values are
+        the smoothed ones, so the final choice is not swayed by an action that got a lucky return in its few visits,
+        and the legal actions never added are masked with -inf.
+        '''
+        legal_actions, visits, values = super().root_statistics(history)
+        node = self.tree.get_node(history.infoset_key)
+        model = self.tree.get_node_data(node) if node is not None else None
+        if model is None and node is not None and self.tree.shared_node_rows(node) is not None:
+            # after a tree-parallel search the model was grown by the workers, in the shared rows
+            model = self.get_value_model(history)
+        if model is not None:
+            q_values = np.full(NUM_ACTION_SLOTS, -np.inf)
+            q_values[model.added_slots] = model.q_values(model.added_slots)
+            values[:, history.get_current_player()] = q_values[action_slots(legal_actions)]
+        return legal_actions, visits, values
 
-        best_action = None
-        best_value = float('-inf')
-        for action in legal_actions:
-            q_value = self.action_value_estimates.get((history, action), defaultdict(float))[current_player]
-            if self.visit_counts.get((history, action), 0) == 0:
-                return action
-            ucb_value = q_value + self.exploration_constant * math.sqrt(
-                math.log(total_visits + 1) / (self.visit_counts[(history, action)] + 1)
-            )
-            if ucb_value > best_value:
-                best_value = ucb_value
-                best_action = action
-        assert best_action is not None, "No best action found"
-        return best_action
+    def backup(self, history: KuhnPokerHistory, node: int, action: int, values: Dict[int, float]):
+        super().backup(history, node, action, values)
+        self.tree.get_node_data(node).update(self.kernel[action_slot(action)], values[history.get_current_player()])
 
 
 if __name__ == '__main__':
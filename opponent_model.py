@@ -0,0 +1,66 @@
+from environment import *
+
+
+@dataclass
+class OpponentModel:
+    '''
+    Counts of the opponent's actions per betting situation and card, learned across episodes.
+
+    A betting situation is the opponent's seat and the bet it faced (None for the opening). When a showdown reveals
+    the opponent's card, its actions are counted under that card. Otherwise the card stays hidden and every action is
+    counted fractionally under each possible card, weighted by the model's posterior of the card (an online
+    expectation step), so episodes ending in a fold still inform the model.
+
+    Action probabilities are the counts smoothed by a symmetric Dirichlet prior with smoothing pseudo-counts per
+    legal action. Every update and query touches a fixed number of counters, so both are O(1).
+    '''
+    smoothing: float = 1.0
+    action_counts: Dict[Tuple, float] = field(default_factory=lambda: defaultdict(float))  # Maps (card, seat, bet faced, action) -> count
+    situation_counts: Dict[Tuple, float] = field(default_factory=lambda: defaultdict(float))  # Maps (card, seat, bet faced) -> count
+    episodes: int = 0
+    showdowns: int = 0
+
+    def action_probability(self, card: int, player: int, bet_amount: Optional[int], action: int) -> float:
+        '''
+        Smoothed probability that the opponent in seat player, holding card and facing bet_amount, takes the action.
+        '''
+        num_actions = len(KuhnPokerState.legal_actions_for(bet_amount, player))
+        return ((self.action_counts.get((card, player, bet_amount, action), 0.0) + self.smoothing)
+                / (self.situation_counts.get((card, player, bet_amount), 0.0) + self.smoothing * num_actions))
+
+    @staticmethod
+    def opponent_decisions(history: KuhnPokerHistory) -> List[Tuple[int, Optional[int], int]]:
+        '''
+        The opponent's decisions along the history of a player: its seat, the bet it faced and its action.
+        '''
+        opponent = 1 - history.get_last_observation().player_index
+        return [(player, decision_history.get_last_observation().bet_amount, action)
+                for decision_history, player, action in history.decisions() if player == opponent]
+
+    def posterior(self, history: KuhnPokerHistory) -> Dict[int, float]:
+        '''
+        Distribution of the opponent's card given the player's own card and the opponent's actions along the history.
+        '''
+        own_card = history.get_last_observation().player_hand
+        decisions = self.opponent_decisions(history)
+        likelihoods = {card: math.prod(self.action_probability(card, player, bet_amount, action)
+                                       for player, bet_amount, action in decisions)
+                       for card in KuhnPokerState.DECK if card != own_card}
+        total = sum(likelihoods.values())
+        return {card: likelihood / total for card, likelihood in likelihoods.items()}
+
+    def observe(self, history: KuhnPokerHistory, opponent_card: Optional[int] = None):
+        '''
+        Counts the opponent's actions in a finished episode, given the player's final history and the opponent's card
+        if a showdown revealed it.
+        '''
+        if opponent_card is None:
+            card_weights = self.posterior(history)
+        else:
+            card_weights = {opponent_card: 1.0}
+            self.showdowns += 1
+        for player, bet_amount, action in self.opponent_decisions(history):
+            for card, weight in card_weights.items():
+                self.action_counts[(card, player, bet_amount, action)] += weight
+                self.situation_counts[(card, player, bet_amount)] += weight
+        self.episodes += 1
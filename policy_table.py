@@ -0,0 +1,202 @@
+import itertools
+from search_tree import *
+
+NUM_CARDS = len(KuhnPokerState.DECK)
+NUM_BET_SIZES = KuhnPokerState.MAX_BET + 1  # Bet amounts player 1 can face: 0 (a check) to MAX_BET
+NUM_INFOSETS = NUM_CARDS + NUM_CARDS * NUM_BET_SIZES  # Player 0's opening per card, player 1's response per card and bet
+
+# The game in tensor form. A strategy of player 0 is a (card, bet) array over its opening actions (bet 0 is a
+# check), a strategy of player 1 a (card, bet faced, response) array with responses FOLD_RESPONSE and CALL_RESPONSE
+# (a call, or a check after a check). Payoffs are player 0's returns as given by KuhnPokerState.get_returns;
+# player 1's payoff is taken to be their negation, which makes the game zero-sum.
+FOLD_RESPONSE = 0
+CALL_RESPONSE = 1
+BET_SIZES = np.arange(NUM_BET_SIZES)
+CALL_SLOTS = action_slots(BET_SIZES)  # Action slot of calling (or checking back) each bet
+DEALS = tuple(itertools.permutations(KuhnPokerState.DECK, 2))  # The 6 equally likely (card 0, card 1) deals
+DEAL_PROBABILITIES = (1 - np.eye(NUM_CARDS)) / (NUM_CARDS * (NUM_CARDS - 1))  # P(player 0's card, player 1's card)
+SHOWDOWN_SIGN = np.where(np.arange(NUM_CARDS)[:, None] > np.arange(NUM_CARDS)[None, :], 1.0, -1.0)  # +1 where player 0 wins
+# Player 0's payoff per (card 0, card 1, bet, response): a fold wins player 1's ante, a showdown wins or loses 1 + bet
+PAYOFFS = np.stack([np.ones((NUM_CARDS, NUM_CARDS, NUM_BET_SIZES)),
+                    SHOWDOWN_SIGN[:, :, None] * (1.0 + BET_SIZES)[None, None, :]], axis=-1)
+
+
+def opening_values(strategy_1: np.ndarray) -> np.ndarray:
+    '''
+    Player 0's expected payoff of every (card, bet) against player 1's strategy, weighted by the deal probabilities
+    (summing the result weighted by a strategy of player 0 gives that strategy's expected payoff).
+    '''
+    return np.einsum('xy,ybr,xybr->xb', DEAL_PROBABILITIES, strategy_1, PAYOFFS)
+
+
+def response_values(strategy_0: np.ndarray) -> np.ndarray:
+    '''
+    Player 1's expected payoff of every (card, bet faced, response) against player 0's strategy, weighted by the
+    deal probabilities and the probability that player 0 makes the bet.
+    '''
+    return -np.einsum('xy,xb,xybr->ybr', DEAL_PROBABILITIES, strategy_0, PAYOFFS)
+
+
+def infoset_index(card: int, player: int, bet_amount: Optional[int]) -> int:
+    '''
+    Maps an information set to its row in a policy table. Rows 0..2 are player 0's opening decision
+    by card; the rest are player 1's response by card and bet amount faced.
+    '''
+    if player == 0:
+        return card
+    return NUM_CARDS + card * NUM_BET_SIZES + bet_amount
+
+
+def infoset_of(index: int) -> Tuple[int, int, Optional[int]]:
+    '''
+    Inverse of infoset_index: returns (card, player, bet_amount) of a row.
+    '''
+    if index < NUM_CARDS:
+        return index, 0, None
+    card, bet_amount = divmod(index - NUM_CARDS, NUM_BET_SIZES)
+    return card, 1, bet_amount
+
+
+def observation_infoset_index(observation: KuhnPokerObservation) -> int:
+    '''
+    Row of the information set of the player to act in the observation.
+    '''
+    return infoset_index(observation.player_hand, observation.current_player, observation.bet_amount)
+
+
+def infoset_history(card: int, player: int, bet_amount: Optional[int]) -> KuhnPokerHistory:
+    '''
+    A history, as the Simulator would build it, that reaches the information set.
+    The opponent's card is not observed, so any card will do.
+    '''
+    opponent_card = next(other for other in KuhnPokerState.DECK if other != card)
+    hands = (card, opponent_card) if player == 0 else (opponent_card, card)
+    state = KuhnPokerState(hands)
+    observations = [state.get_observation(player)]
+    if player == 1:
+        observations.append(state.apply_action(bet_amount, 0).get_observation(player))
+    return KuhnPokerHistory(observations)
+
+
+def legal_action_mask() -> np.ndarray:
+    '''
+    Boolean (NUM_INFOSETS, NUM_ACTION_SLOTS) array of the legal actions of every information set.
+    '''
+    mask = np.zeros((NUM_INFOSETS, NUM_ACTION_SLOTS), dtype=bool)
+    for index in range(NUM_INFOSETS):
+        card, player, bet_amount = infoset_of(index)
+        mask[index, action_slots(KuhnPokerState.legal_actions_for(bet_amount, player))] = True
+    return mask
+
+
+class PolicyTable:
+    '''
+    Action probabilities for every information set of the game, as one (NUM_INFOSETS, NUM_ACTION_SLOTS) array.
+
+    Rows are indexed by infoset_index and columns by action slot (see search_tree.action_slot); illegal
+    actions have probability 0. Tables are saved as .npy files, which load memory-mapped.
+    '''
+    def __init__(self, probabilities: np.ndarray):
+        if probabilities.shape != (NUM_INFOSETS, NUM_ACTION_SLOTS):
+            raise ValueError(f"Expected a policy table of shape {(NUM_INFOSETS, NUM_ACTION_SLOTS)}, got {probabilities.shape}")
+        self.probabilities = probabilities
+
+    @staticmethod
+    def uniform() -> 'PolicyTable':
+        '''
+        The policy of the RandomPlayer: uniform over the legal actions of every information set.
+        '''
+        mask = legal_action_mask()
+        return PolicyTable(mask / mask.sum(axis=1, keepdims=True))
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> 'PolicyTable':
+        return PolicyTable(np.load(path, mmap_mode='r' if mmap else None))
+
+    def save(self, path: str):
+        np.save(path, np.ascontiguousarray(self.probabilities, dtype=np.float64))
+
+    @staticmethod
+    def from_tensors(strategy_0: np.ndarray, strategy_1: np.ndarray) -> 'PolicyTable':
+        '''
+        Builds a table from a (NUM_CARDS, NUM_BET_SIZES) strategy of player 0 and a (NUM_CARDS, NUM_BET_SIZES, 2)
+        strategy of player 1 (see PAYOFFS for the layout).
+        '''
+        probabilities = np.zeros((NUM_INFOSETS, NUM_ACTION_SLOTS))
+        probabilities[:NUM_CARDS, action_slot(ActionType.CHECK):] = strategy_0
+        responses = probabilities[NUM_CARDS:].reshape(NUM_CARDS, NUM_BET_SIZES, NUM_ACTION_SLOTS)
+        responses[:, :, action_slot(ActionType.FOLD)] = strategy_1[:, :, FOLD_RESPONSE]
+        responses[:, BET_SIZES, CALL_SLOTS] = strategy_1[:, :, CALL_RESPONSE]
+        return PolicyTable(probabilities)
+
+    def to_tensors(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Inverse of from_tensors: returns the strategies of player 0 and player 1 as arrays.
+        '''
+        strategy_0 = np.array(self.probabilities[:NUM_CARDS, action_slot(ActionType.CHECK):])
+        responses = np.asarray(self.probabilities[NUM_CARDS:]).reshape(NUM_CARDS, NUM_BET_SIZES, NUM_ACTION_SLOTS)
+        strategy_1 = np.stack([responses[:, :, action_slot(ActionType.FOLD)],
+                               responses[:, BET_SIZES, CALL_SLOTS]], axis=-1)
+        return strategy_0, strategy_1
+
+    def action_probabilities(self, card: int, player: int, bet_amount: Optional[int]) -> np.ndarray:
+        return self.probabilities[infoset_index(card, player, bet_amount)]
+
+    def to_dict(self) -> Dict[Tuple[int, int, Optional[int]], Dict[int, float]]:
+        '''
+        Maps every information set (card, player, bet_amount) to its actions with non-zero probability.
+        '''
+        policy = {}
+        for index in range(NUM_INFOSETS):
+            slots = np.flatnonzero(self.probabilities[index])
+            policy[infoset_of(index)] = {int(slot) + ActionType.FOLD: float(self.probabilities[index, slot]) for slot in slots}
+        return policy
+
+
+def compile_policy(player: Player, num_samples: int = 1) -> PolicyTable:
+    '''
+    Compiles the root decisions of a player into a PolicyTable.
+
+    choose_action is called num_samples times in every information set and the table holds the
+    observed action frequencies, so stochastic players (e.g. MCTS) need several samples per row.
+    '''
+    probabilities = np.zeros((NUM_INFOSETS, NUM_ACTION_SLOTS))
+    for index in range(NUM_INFOSETS):
+        card, player_id, bet_amount = infoset_of(index)
+        history = infoset_history(card, player_id, bet_amount)
+        for _ in range(num_samples):
+            probabilities[index, action_slot(player.choose_action(history, player_id))] += 1
+    return PolicyTable(probabilities / num_samples)
+
+
+class TablePlayer(Player):
+    '''
+    Plays from a precomputed PolicyTable: a decision is one row lookup and one draw.
+    '''
+    def __init__(self, table, greedy: bool = False):
+        self.table = PolicyTable.load(table) if isinstance(table, str) else table  # A PolicyTable or the path of a saved one
+        self.greedy = greedy  # Play the most likely action instead of sampling
+
+    def choose_action(self, history: KuhnPokerHistory, player_id: int) -> int:
+        index = observation_infoset_index(history.get_last_observation())
+        if self.greedy:
+            return int(self.table.probabilities[index].argmax()) + ActionType.FOLD
+        # only the looked-up row is read, so a memory-mapped table stays on disk
+        cumulative = np.cumsum(self.table.probabilities[index])
+        # scaling by the row total keeps the draw inside the legal actions despite rounding
+        slot = int(cumulative.searchsorted(random.random() * cumulative[-1], side='right'))
+        return slot + ActionType.FOLD
+
+    def get_policy(self) -> Dict:
+        return self.table.to_dict()
+
+
+if __name__ == '__main__':
+    from mcts import HistoryMCTSPlayer
+
+    # Compile a search player once, then serve its decisions from the table
+    table = compile_policy(HistoryMCTSPlayer(num_simulations=100, exploration_constant=1.0))
+    table.save('policy.npy')
+    simulator = Simulator([TablePlayer('policy.npy'), RandomPlayer()])
+    results = simulator.simulate_episodes(1000)
+    print(results)
@@ -0,0 +1,211 @@
+import functools
+from environment import *
+
+NO_BET = -1  # bet_amount entry for rollouts where no bet has been made yet (None in KuhnPokerState)
+MIN_BATCHED_ROLLOUTS = 4  # Below this many rollouts per leaf, playing them one by one is cheaper than the array setup
+
+
+class LeafEvaluator(str, enum.Enum):
+    ROLLOUT = 'rollout'  # Sampled uniformly random playouts
+    EXACT = 'exact'  # Exact expected return of a uniformly random playout
+
+
+class RolloutBatch:
+    '''
+    N Kuhn poker games advanced together as NumPy arrays.
+
+    Mirrors the rules of KuhnPokerState.apply_action and KuhnPokerState.get_returns, one array
+    entry per game, so a whole batch of playouts costs a handful of array operations per step.
+    '''
+    def __init__(self, players_hands: np.ndarray, bets: np.ndarray, folded: np.ndarray,
+                 current_player: np.ndarray, bet_amount: np.ndarray, winner: np.ndarray):
+        self.players_hands = players_hands  # (N, 2) cards
+        self.bets = bets  # (N, 2) individual player bets
+        self.folded = folded  # (N, 2) fold flags
+        self.current_player = current_player  # (N,) player to act, PlayerType.TERMINAL when over
+        self.bet_amount = bet_amount  # (N,) amount of the bet, NO_BET if no bet has been made
+        self.winner = winner  # (N,) winner, -1 while the game is running
+
+    @staticmethod
+    def from_state(state: KuhnPokerState, num_rollouts: int) -> 'RolloutBatch':
+        '''
+        Creates num_rollouts copies of the state.
+        '''
+        return RolloutBatch(
+            players_hands=np.tile(np.array(state.players_hands, dtype=np.int64), (num_rollouts, 1)),
+            bets=np.tile(np.array(state.bets, dtype=np.int64), (num_rollouts, 1)),
+            folded=np.tile(np.array(state.folded, dtype=bool), (num_rollouts, 1)),
+            current_player=np.full(num_rollouts, state.current_player_index, dtype=np.int64),
+            bet_amount=np.full(num_rollouts, NO_BET if state.bet_amount is None else state.bet_amount, dtype=np.int64),
+            winner=np.full(num_rollouts, -1 if state.winner is None else state.winner, dtype=np.int64),
+        )
+
+    @staticmethod
+    def from_hands(players_hands: np.ndarray) -> 'RolloutBatch':
+        '''
+        Creates freshly dealt games (antes posted, player 0 to act) for an (N, 2) array of hands.
+        '''
+        num_games = players_hands.shape[0]
+        return RolloutBatch(
+            players_hands=np.asarray(players_hands, dtype=np.int64),
+            bets=np.ones((num_games, 2), dtype=np.int64),
+            folded=np.zeros((num_games, 2), dtype=bool),
+            current_player=np.zeros(num_games, dtype=np.int64),
+            bet_amount=np.full(num_games, NO_BET, dtype=np.int64),
+            winner=np.full(num_games, -1, dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return self.current_player.shape[0]
+
+    def active(self) -> np.ndarray:
+        return self.current_player != PlayerType.TERMINAL
+
+    def all_terminal(self) -> bool:
+        return not self.active().any()
+
+    def sample_uniform_actions(self) -> np.ndarray:
+        '''
+        Samples a uniformly random legal action for every game (entries of finished games are ignored).
+        '''
+        num_games = len(self)
+        opening = self.bet_amount == NO_BET
+        opening_actions = np.random.randint(ActionType.CHECK, KuhnPokerState.MAX_BET + 1, size=num_games)
+        response_actions = np.where(np.random.random(num_games) < 0.5, ActionType.FOLD, self.bet_amount)
+        return np.where(opening, opening_actions, response_actions)
+
+    def apply_actions(self, actions: np.ndarray):
+        '''
+        Applies one action to every running game. Actions are assumed to be legal.
+        '''
+        active = self.active()
+        rows = np.arange(len(self))
+        player = self.current_player
+        opening = active & (self.bet_amount == NO_BET)
+        response = active & ~opening
+        fold = response & (actions == ActionType.FOLD)
+        call = response & ~fold  # CALL, or CHECK after a check (bet_amount is 0)
+
+        # first check or bet: the bet amount is set and the turn passes
+        opening_rows = rows[opening]
+        self.bets[opening_rows, player[opening_rows]] += actions[opening_rows]
+        self.bet_amount = np.where(opening, actions, self.bet_amount)
+
+        # call or second check: showdown
+        call_rows = rows[call]
+        self.bets[call_rows, player[call_rows]] += self.bet_amount[call_rows]
+        showdown_winner = np.where(self.players_hands[:, 0] > self.players_hands[:, 1], 0, 1)
+
+        # fold: the other player wins
+        fold_rows = rows[fold]
+        self.folded[fold_rows, player[fold_rows]] = True
+
+        self.winner = np.where(call, showdown_winner, np.where(fold, 1 - player, self.winner))
+        self.current_player = np.where(opening, 1 - player, np.where(response, PlayerType.TERMINAL, player))
+
+    def get_returns(self) -> np.ndarray:
+        '''
+        Returns an (N, 2) array of returns with the same convention as KuhnPokerState.get_returns.
+        '''
+        returns = np.zeros((len(self), 2))
+        player_0_won = self.winner == 0
+        player_1_won = self.winner == 1
+        returns[player_0_won, 0] = self.bets[player_0_won, 1]
+        returns[player_0_won, 1] = self.bets[player_0_won, 1]
+        returns[player_1_won, 0] = -self.bets[player_1_won, 0]
+        returns[player_1_won, 1] = self.bets[player_1_won, 0]
+        return returns
+
+    def play_uniformly_random(self) -> int:
+        '''
+        Plays all games to the end with uniformly random legal actions. Returns the number of actions applied.
+        '''
+        actions_applied = 0
+        active = self.active()
+        while active.any():
+            actions_applied += int(active.sum())
+            self.apply_actions(self.sample_uniform_actions())
+            active = self.active()
+        return actions_applied
+
+
+def batched_rollout_returns(state: KuhnPokerState, num_rollouts: int) -> Tuple[np.ndarray, int]:
+    '''
+    Plays num_rollouts uniformly random playouts from the state together.
+    Returns the (num_rollouts, 2) array of returns and the number of actions applied.
+
+    A game has at most two actions left (an opening and a response), so both are drawn up front with one RNG call
+    and the returns follow in closed form, with the same convention as KuhnPokerState.get_returns: both entries
+    are the loser's final bet, player 0's negated when player 1 wins.
+    '''
+    if state.is_terminal():
+        returns = state.get_returns()
+        return np.tile([returns[0], returns[1]], (num_rollouts, 1)), 0
+    draws = np.random.random((2, num_rollouts))
+    player = state.current_player_index
+    if state.bet_amount is None:
+        # opening: a check (bet of 0) or a bet, uniformly, then the other player responds
+        opener, responder = player, 1 - player
+        bet_amount = np.floor(draws[0] * (KuhnPokerState.MAX_BET + 1))
+        opener_bet = state.bets[opener] + bet_amount
+        fold = draws[1] < 0.5
+        actions_applied = 2 * num_rollouts
+    else:
+        opener, responder = 1 - player, player
+        bet_amount = state.bet_amount
+        opener_bet = state.bets[opener]
+        fold = draws[0] < 0.5
+        actions_applied = num_rollouts
+    # a fold loses the responder's bet to the opener; a call (or a check after a check) goes to showdown
+    showdown_winner = 0 if state.players_hands[0] > state.players_hands[1] else 1
+    showdown_loser_bet = opener_bet if showdown_winner == responder else state.bets[responder] + bet_amount
+    returns = np.empty((num_rollouts, 2))
+    returns[:, 1] = np.where(fold, state.bets[responder], showdown_loser_bet)
+    player_0_sign = np.where(fold, 1 if opener == 0 else -1, 1 if showdown_winner == 0 else -1)
+    np.multiply(returns[:, 1], player_0_sign, out=returns[:, 0])
+    return returns, actions_applied
+
+
+def batched_rollout_values(state: KuhnPokerState, num_rollouts: int, return_variance: bool = False):
+    '''
+    Plays num_rollouts uniformly random playouts from the state together.
+
+    Returns the mean return per player, and additionally the sample variance per player if return_variance is set.
+    '''
+    returns, _ = batched_rollout_returns(state, num_rollouts)
+    means = returns.mean(axis=0)
+    mean_values = {player: float(means[player]) for player in range(2)}
+    if not return_variance:
+        return mean_values
+    variances = returns.var(axis=0, ddof=1) if num_rollouts > 1 else np.zeros(2)
+    return mean_values, {player: float(variances[player]) for player in range(2)}
+
+
+def exact_rollout_values(state: KuhnPokerState) -> dict[int, float]:
+    '''
+    Returns the exact expected returns of a uniformly random playout from the state.
+
+    The game is at most two actions deep, so the expectation is enumerated once per compact
+    state and memoized; later calls are a single cache lookup.
+    '''
+    values = _exact_rollout_values(state.players_hands, state.bets, state.folded, state.current_player_index,
+                                   state.bet_amount, state.winner)
+    return {0: values[0], 1: values[1]}
+
+
+@functools.lru_cache(maxsize=None)
+def _exact_rollout_values(players_hands: Tuple[int, ...], bets: Tuple[int, ...], folded: Tuple[bool, ...],
+                          current_player: int, bet_amount: Optional[int], winner: Optional[int]) -> Tuple[float, float]:
+    state = KuhnPokerState._make(players_hands, bets, folded, current_player, bet_amount, winner)
+    if state.is_terminal():
+        returns = state.get_returns()
+        return (returns[0], returns[1])
+    legal_actions = state.get_legal_actions()
+    totals = [0.0, 0.0]
+    for action in legal_actions:
+        child = state.apply_action(action, current_player)
+        child_values = _exact_rollout_values(child.players_hands, child.bets, child.folded, child.current_player_index,
+                                             child.bet_amount, child.winner)
+        totals[0] += child_values[0]
+        totals[1] += child_values[1]
+    return (totals[0] / len(legal_actions), totals[1] / len(legal_actions))
@@ -0,0 +1,539 @@
+from multiprocessing import shared_memory
+from environment import *
+
+NUM_PLAYERS = 2
+NUM_ACTION_SLOTS = KuhnPokerState.MAX_BET + 2  # FOLD, CHECK and bets 1..MAX_BET
+_SLOT_OFFSET = int(ActionType.FOLD)  # Plain int, NumPy arithmetic with the IntEnum member is slow
+ENTRIES_PER_NODE = 4  # Initial statistics entries allocated per node of capacity; most nodes have 2 legal actions
+SCALAR_SELECTION_MAX_ACTIONS = 8  # Below this many candidates a loop over plain floats beats NumPy's per-call overhead
+
+
+def action_slot(action: int) -> int:
+    '''
+    Maps an action to its column in the node arrays: FOLD -> 0, CHECK -> 1, bet x -> x + 1.
+    '''
+    return action - _SLOT_OFFSET
+
+
+def action_slots(actions: Iterable[int]) -> np.ndarray:
+    return np.fromiter(actions, dtype=np.int64) - _SLOT_OFFSET
+
+
+class ActionLayout:
+    '''
+    Where the statistics of a set of legal actions live within a node's row: one column per legal action, in the
+    order of the legal actions. Nodes with the same legal actions share one layout.
+    '''
+    __slots__ = ('width', 'slots', 'columns', 'column_list')
+
+    def __init__(self, legal_actions: Tuple[int, ...]):
+        self.width = len(legal_actions)
+        self.slots = action_slots(legal_actions)  # Action slot of every column
+        self.columns = np.full(NUM_ACTION_SLOTS, -1, dtype=np.int64)  # Maps action slot -> column, -1 if illegal
+        self.columns[self.slots] = np.arange(self.width)
+        self.column_list = self.columns.tolist()  # Same as columns, for scalar lookups
+
+
+_layouts = {}  # Maps legal actions -> their ActionLayout
+
+
+def action_layout(legal_actions: Tuple[int, ...]) -> ActionLayout:
+    layout = _layouts.get(legal_actions)
+    if layout is None:
+        layout = _layouts[legal_actions] = ActionLayout(tuple(legal_actions))
+    return layout
+
+
+class EvictionPolicy(str, enum.Enum):
+    LRU = 'lru'  # Evict the nodes touched longest ago
+    VISITS = 'visits'  # Evict the nodes with the fewest visits
+    AGE = 'age'  # Evict the nodes expanded first
+
+
+class SearchTree:
+    '''
+    Node-table storage for MCTS statistics.
+
+    Every expanded key (an InfosetKey) gets an integer node id. Per-action visit counts and
+    per-player Q values of a node live in a contiguous row of flat NumPy arrays, one entry per legal
+    action (see ActionLayout), so a selection step only needs one dict lookup to find the node and a
+    response node with 2 legal actions stores 2 entries rather than one per action slot.
+    Rows freed by eviction are reused by nodes of the same width.
+
+    With max_nodes set the tree never holds more nodes than that: when it is full, a batch of
+    evict_fraction * max_nodes nodes is evicted according to eviction_policy before a new node is
+    added. Nodes touched during the current simulation (see tick) are never evicted.
+    '''
+    def __init__(self, initial_capacity: int = 64, max_nodes: Optional[int] = None,
+                 eviction_policy: str = EvictionPolicy.LRU, evict_fraction: float = 0.1):
+        if max_nodes is not None:
+            initial_capacity = min(initial_capacity, max_nodes)
+        self.max_nodes = max_nodes
+        self.eviction_policy = EvictionPolicy(eviction_policy)
+        self.evict_fraction = evict_fraction
+        self.node_ids = {}  # Maps key -> node id
+        self.keys = []  # Maps node id -> key, None for free ids
+        self.legal_actions = []  # Maps node id -> legal actions of the node
+        self.legal_slots = []  # Maps node id -> action slots of the legal actions, for selection
+        self.layouts = []  # Maps node id -> ActionLayout of the node's row
+        self.offsets = []  # Maps node id -> first entry of the node's row
+        self.node_data = []  # Maps node id -> per-node data of the player (e.g. action subsets), None if unset
+        self.free_nodes = []  # Node ids released by eviction, reused first
+        self.free_rows = defaultdict(list)  # Maps row width -> offsets of rows released by eviction
+        self.num_entries = 0  # Entries allocated to rows so far
+        self.node_visits = np.zeros(initial_capacity, dtype=np.int64)  # Total visits per node
+        self.visit_counts = np.zeros(ENTRIES_PER_NODE * initial_capacity, dtype=np.int64)  # Visits per entry (node, legal action)
+        self.action_values = np.zeros((ENTRIES_PER_NODE * initial_capacity, NUM_PLAYERS))  # Q values per (entry, player)
+        self.last_touch = np.zeros(initial_capacity, dtype=np.int64)  # Clock value of the last lookup per node
+        self.created = np.zeros(initial_capacity, dtype=np.int64)  # Clock value at expansion per node
+        self.clock = 0  # Advanced once per simulation
+        self.evictions = 0  # Nodes evicted so far
+        self.reexpansions = 0  # Expansions of keys that had been evicted before
+        self._evicted_hashes = {}  # Hashes of recently evicted keys (insertion ordered, at most max_nodes)
+
+    _NODE_ARRAYS = ('node_visits', 'last_touch', 'created')
+    _ENTRY_ARRAYS = ('visit_counts', 'action_values')
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.node_ids
+
+    @property
+    def capacity(self) -> int:
+        return self.node_visits.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        Bytes held by the statistics arrays (allocated capacity, not only used rows).
+        '''
+        return sum(getattr(self, name).nbytes for name in self._NODE_ARRAYS + self._ENTRY_ARRAYS)
+
+    def tick(self):
+        '''
+        Starts a new simulation for the purpose of eviction.
+        '''
+        self.clock += 1
+
+    def get_node(self, key: Hashable) -> Optional[int]:
+        node = self.node_ids.get(key)
+        if node is not None and self.max_nodes is not None:
+            self.last_touch[node] = self.clock
+        return node
+
+    def add_node(self, key: Hashable, legal_actions: List[int]) -> int:
+        '''
+        Expands a new node for the key with all statistics set to 0 and returns its id.
+        '''
+        if self.max_nodes is not None and len(self.node_ids) >= self.max_nodes:
+            self.evict(max(1, int(self.evict_fraction * self.max_nodes)))
+        layout = action_layout(legal_actions)
+        offset = self._allocate_row(layout.width)
+        if self.free_nodes:
+            node = self.free_nodes.pop()
+            self.keys[node] = key
+            self.legal_actions[node] = legal_actions
+            self.legal_slots[node] = layout.slots
+            self.layouts[node] = layout
+            self.offsets[node] = offset
+            self.node_data[node] = None
+        else:
+            node = len(self.keys)
+            if node == self.capacity:
+                new_capacity = 2 * self.capacity
+                if self.max_nodes is not None:
+                    # a simulation may briefly hold one node more than max_nodes if nothing is evictable
+                    new_capacity = max(min(new_capacity, self.max_nodes), self.capacity + 1)
+                self._grow(new_capacity)
+            self.keys.append(key)
+            self.legal_actions.append(legal_actions)
+            self.legal_slots.append(layout.slots)
+            self.layouts.append(layout)
+            self.offsets.append(offset)
+            self.node_data.append(None)
+        self.node_ids[key] = node
+        if self.max_nodes is not None:
+            self.last_touch[node] = self.clock
+            self.created[node] = self.clock
+            if self._evicted_hashes.pop(hash(key), None) is not None:
+                self.reexpansions += 1
+        return node
+
+    def _allocate_row(self, width: int) -> int:
+        '''
+        Returns the offset of a zeroed row of width entries, reusing a released one if possible.
+        '''
+        free_rows = self.free_rows.get(width)
+        if free_rows:
+            return free_rows.pop()
+        offset = self.num_entries
+        self.num_entries += width
+        entry_capacity = self.visit_counts.shape[0]
+        if self.num_entries > entry_capacity:
+            new_capacity = max(2 * entry_capacity, self.num_entries)
+            for name in self._ENTRY_ARRAYS:
+                setattr(self, name, self._resized(getattr(self, name), new_capacity))
+        return offset
+
+    def _row(self, node: int, slot: int) -> int:
+        '''
+        Entry of an action slot of the node.
+        '''
+        return self.offsets[node] + self.layouts[node].column_list[slot]
+
+    def _rows(self, node: int, slots: np.ndarray):
+        '''
+        Entries of an array of action slots of the node, as a slice when they are all its legal actions in order.
+        '''
+        layout = self.layouts[node]
+        offset = self.offsets[node]
+        if slots is layout.slots:
+            return slice(offset, offset + layout.width)
+        return offset + layout.columns[slots]
+
+    def evict(self, num_nodes: int) -> int:
+        '''
+        Evicts up to num_nodes nodes chosen by the eviction policy, skipping nodes touched in the
+        current simulation. Returns the number of evicted nodes.
+        '''
+        live = np.fromiter(self.node_ids.values(), dtype=np.int64)
+        candidates = live[self.last_touch[live] < self.clock]
+        if len(candidates) == 0:
+            return 0
+        if self.eviction_policy == EvictionPolicy.LRU:
+            scores = self.last_touch[candidates]
+        elif self.eviction_policy == EvictionPolicy.VISITS:
+            scores = self.node_visits[candidates]
+        else:
+            scores = self.created[candidates]
+        num_nodes = min(num_nodes, len(candidates))
+        victims = candidates[np.argpartition(scores, num_nodes - 1)[:num_nodes]]
+        for node in victims.tolist():
+            key = self.keys[node]
+            del self.node_ids[key]
+            self.keys[node] = None
+            self.legal_actions[node] = None
+            self.legal_slots[node] = None
+            self.node_data[node] = None
+            self.free_nodes.append(node)
+            rows = slice(self.offsets[node], self.offsets[node] + self.layouts[node].width)
+            for name in self._ENTRY_ARRAYS:
+                getattr(self, name)[rows] = 0
+            self.free_rows[self.layouts[node].width].append(self.offsets[node])
+            self.layouts[node] = None
+            self.offsets[node] = None
+            self._evicted_hashes[hash(key)] = True
+        while len(self._evicted_hashes) > self.max_nodes:
+            del self._evicted_hashes[next(iter(self._evicted_hashes))]
+        for name in self._NODE_ARRAYS:
+            getattr(self, name)[victims] = 0
+        self.evictions += len(victims)
+        return len(victims)
+
+    def _grow(self, new_capacity: int):
+        for name in self._NODE_ARRAYS:
+            setattr(self, name, self._resized(getattr(self, name), new_capacity))
+
+    @staticmethod
+    def _resized(array: np.ndarray, new_capacity: int) -> np.ndarray:
+        out = np.zeros((new_capacity,) + array.shape[1:], dtype=array.dtype)
+        out[:array.shape[0]] = array
+        return out
+
+    def get_node_data(self, node: int):
+        return self.node_data[node]
+
+    def shared_node_rows(self, node: int) -> Optional[Dict[str, np.ndarray]]:
+        '''
+        The node's rows of the per-node arrays shared between workers (see SharedSearchTree), None if the tree is not shared.
+        '''
+        return None
+
+    def set_node_data(self, node: int, data):
+        self.node_data[node] = data
+
+    def get_visits(self, node: int, action: int) -> int:
+        return int(self.visit_counts[self._row(node, action_slot(action))])
+
+    def get_value(self, node: int, action: int, player: int) -> float:
+        return float(self.action_values[self._row(node, action_slot(action)), player])
+
+    def get_total_visits(self, node: int) -> int:
+        return int(self.node_visits[node])
+
+    def get_action_statistics(self, node: Optional[int], actions: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the visit counts (shape (A,)) and Q values (shape (A, 2)) of the actions at the node.
+        Statistics of a node that was never expanded (node is None) are all 0.
+        '''
+        slots = action_slots(actions)
+        if node is None:
+            return np.zeros(len(slots), dtype=np.int64), np.zeros((len(slots), NUM_PLAYERS))
+        rows = self._rows(node, slots)
+        return self.visit_counts[rows].copy(), self.action_values[rows].copy()
+
+    def slot_statistics(self, node: int, slots: np.ndarray, player: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the visit counts and the player's Q values at the node for an array of action slots.
+        '''
+        rows = self._rows(node, slots)
+        return self.visit_counts[rows], self.action_values[rows, player]
+
+    def select_ucb(self, node: int, slots: np.ndarray, player: int, exploration_constant: float, offset: int = 0) -> int:
+        '''
+        UCB selection over the candidate action slots of a node, as one array expression.
+
+        Returns the action of the first unvisited candidate if there is one, otherwise the candidate maximizing
+        Q + c * sqrt(log(N + offset) / (n + offset)), taking the first one on ties.
+        '''
+        visits, q_values = self.slot_statistics(node, slots, player)
+        if len(slots) < SCALAR_SELECTION_MAX_ACTIONS:
+            return self._select_ucb_scalar(node, slots, visits.tolist(), q_values.tolist(), exploration_constant, offset)
+        # visits are never negative, so the first minimum is the first unvisited candidate if there is one
+        least_visited = visits.argmin()
+        if visits[least_visited] == 0:
+            return int(slots[least_visited]) + _SLOT_OFFSET
+        log_total = math.log(self.get_total_visits(node) + offset)
+        ucb_values = q_values + exploration_constant * np.sqrt(log_total / (visits + offset))
+        return int(slots[ucb_values.argmax()]) + _SLOT_OFFSET
+
+    def _select_ucb_scalar(self, node: int, slots: np.ndarray, visits: List[int], q_values: List[float],
+                           exploration_constant: float, offset: int) -> int:
+        # same rule and tie-break as select_ucb, for a handful of candidates
+        if 0 in visits:
+            return int(slots[visits.index(0)]) + _SLOT_OFFSET
+        log_total = math.log(self.get_total_visits(node) + offset)
+        best_index = 0
+        best_value = -math.inf
+        for index, (action_visits, q_value) in enumerate(zip(visits, q_values)):
+            ucb_value = q_value + exploration_constant * math.sqrt(log_total / (action_visits + offset))
+            if ucb_value > best_value:
+                best_index, best_value = index, ucb_value
+        return int(slots[best_index]) + _SLOT_OFFSET
+
+    def add_virtual_loss(self, node: int, action: int):
+        '''
+        Marks the action as being simulated. Only trees shared between concurrent workers use virtual loss.
+        '''
+        pass
+
+    def revert_virtual_loss(self, node: int, action: int):
+        pass
+
+    def update(self, node: int, action: int, values: Dict[int, float]):
+        '''
+        Records one visit of the action and folds the simulated values into the running mean Q values.
+        '''
+        row = self._row(node, action_slot(action))
+        self.node_visits[node] += 1
+        self.visit_counts[row] += 1
+        visits = self.visit_counts[row]
+        q_values = self.action_values[row]
+        for player, value in values.items():
+            q_values[player] += (value - q_values[player]) / visits
+
+    def clear(self):
+        '''
+        Removes all nodes. The eviction counters are cumulative and are kept.
+        '''
+        self.node_ids.clear()
+        self.keys.clear()
+        self.legal_actions.clear()
+        self.legal_slots.clear()
+        self.layouts.clear()
+        self.offsets.clear()
+        self.node_data.clear()
+        self.free_nodes.clear()
+        self.free_rows.clear()
+        self.num_entries = 0
+        self._evicted_hashes.clear()
+        for name in self._NODE_ARRAYS + self._ENTRY_ARRAYS:
+            getattr(self, name)[:] = 0
+
+
+class SharedSearchTree(SearchTree):
+    '''
+    SearchTree whose statistics live in multiprocessing.shared_memory blocks, so several worker
+    processes can grow one tree together (tree parallelism).
+
+    Keys are assigned node ids through a shared index (a multiprocessing.Manager dict) under a lock;
+    every worker caches the ids it has seen locally. Statistics are updated without locking, as in
+    lock-free tree-parallel MCTS: rare lost updates are accepted in exchange for no contention.
+    Every node has a full row of NUM_ACTION_SLOTS entries, since the capacity is fixed up front.
+    While a worker simulates an action it holds a virtual loss on it (virtual_loss extra visits
+    with the worst possible return), which steers concurrent workers to other branches.
+    The capacity is fixed when the tree is created.
+
+    Node data stays local to each process. Players whose node data must be shared between workers
+    declare per-node arrays (node_arrays maps name -> (row shape, dtype)), which are allocated in
+    shared memory alongside the statistics and handed out per node by shared_node_rows.
+    '''
+    VIRTUAL_LOSS_VALUE = -float(KuhnPokerState.MAX_BET + 1)  # Worst possible return of a hand
+
+    def __init__(self, capacity: int, index, lock, shm_names: Optional[Dict[str, str]] = None, virtual_loss: int = 1,
+                 node_arrays: Optional[Dict[str, Tuple[Tuple[int, ...], type]]] = None):
+        self.index = index  # Shared mapping key -> node id
+        self.lock = lock  # Guards node allocation
+        self.virtual_loss = virtual_loss
+        self.max_nodes = None  # Shared trees are sized for the whole search and never evict
+        self.clock = 0
+        self.node_ids = {}  # Local cache of the shared index
+        self.keys = {}  # Maps node id -> key for the nodes this process has seen
+        self.legal_actions = {}  # Maps node id -> legal actions for the nodes this process has seen
+        self.legal_slots = {}  # Maps node id -> action slots of the legal actions for the nodes this process has seen
+        self.node_data = {}  # Maps node id -> per-node data of this process's player
+        create = shm_names is None
+        self._blocks = {}
+        self.header = self._attach('header', (1,), np.int64, shm_names, create)  # Number of allocated nodes
+        self.node_visits = self._attach('node_visits', (capacity,), np.int64, shm_names, create)
+        self.visit_counts = self._attach('visit_counts', (capacity * NUM_ACTION_SLOTS,), np.int64, shm_names, create)
+        self.action_values = self._attach('action_values', (capacity * NUM_ACTION_SLOTS, NUM_PLAYERS), np.float64, shm_names, create)
+        self.node_virtual_visits = self._attach('node_virtual_visits', (capacity,), np.int64, shm_names, create)
+        self.virtual_visits = self._attach('virtual_visits', (capacity * NUM_ACTION_SLOTS,), np.int64, shm_names, create)
+        self.node_array_specs = dict(node_arrays or {})
+        self.node_arrays = {name: self._attach(name, (capacity,) + shape, dtype, shm_names, create)
+                            for name, (shape, dtype) in self.node_array_specs.items()}  # Maps name -> shared per-node array
+
+    def _attach(self, name: str, shape: Tuple[int, ...], dtype, shm_names: Optional[Dict[str, str]], create: bool) -> np.ndarray:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if create:
+            block = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            block = shared_memory.SharedMemory(name=shm_names[name])
+        self._blocks[name] = block
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if create:
+            array[...] = 0
+        return array
+
+    def handle(self) -> Tuple:
+        '''
+        Picklable description of the tree that workers pass to SharedSearchTree.attach.
+        '''
+        return (self.capacity, self.index, {name: block.name for name, block in self._blocks.items()}, self.virtual_loss,
+                self.node_array_specs)
+
+    @staticmethod
+    def attach(handle: Tuple, lock) -> 'SharedSearchTree':
+        capacity, index, shm_names, virtual_loss, node_arrays = handle
+        return SharedSearchTree(capacity, index, lock, shm_names=shm_names, virtual_loss=virtual_loss, node_arrays=node_arrays)
+
+    def close(self):
+        '''
+        Detaches this process from the shared blocks.
+        '''
+        # node data may hold views of the shared per-node arrays
+        self.node_data = {}
+        self.node_arrays = {}
+        for name in list(self._blocks):
+            # drop the array views before closing the buffers they point into
+            setattr(self, name, None)
+            self._blocks.pop(name).close()
+
+    def unlink(self):
+        '''
+        Detaches and frees the shared blocks. Called once, by the process that created the tree.
+        '''
+        blocks = list(self._blocks.values())
+        self.close()
+        for block in blocks:
+            block.unlink()
+
+    def __len__(self) -> int:
+        return int(self.header[0])
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get_node(key) is not None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(block.size for block in self._blocks.values())
+
+    def get_node(self, key: Hashable) -> Optional[int]:
+        node = self.node_ids.get(key)
+        if node is None:
+            node = self.index.get(key)
+            if node is not None:
+                self._cache(key, node)
+        return node
+
+    def _cache(self, key: Hashable, node: int):
+        self.node_ids[key] = node
+        self.keys[node] = key
+        self.legal_actions[node] = key.get_legal_actions()
+        self.legal_slots[node] = action_slots(self.legal_actions[node])
+
+    def add_node(self, key: Hashable, legal_actions: List[int]) -> int:
+        '''
+        Returns the node of the key, allocating it if no worker has done so yet.
+        '''
+        with self.lock:
+            node = self.index.get(key)
+            if node is None:
+                node = int(self.header[0])
+                if node == self.capacity:
+                    raise RuntimeError(f"Shared search tree is full ({self.capacity} nodes)")
+                self.header[0] += 1
+                self.index[key] = node
+        self.node_ids[key] = node
+        self.keys[node] = key
+        self.legal_actions[node] = legal_actions
+        self.legal_slots[node] = action_slots(legal_actions)
+        return node
+
+    def _row(self, node: int, slot: int) -> int:
+        return node * NUM_ACTION_SLOTS + slot
+
+    def _rows(self, node: int, slots: np.ndarray) -> np.ndarray:
+        return node * NUM_ACTION_SLOTS + slots
+
+    def _grow(self, new_capacity: int):
+        raise RuntimeError("Shared search trees have a fixed capacity")
+
+    def get_node_data(self, node: int):
+        return self.node_data.get(node)
+
+    def shared_node_rows(self, node: int) -> Optional[Dict[str, np.ndarray]]:
+        return {name: array[node] for name, array in self.node_arrays.items()}
+
+    def clear(self):
+        raise RuntimeError("Shared search trees are discarded after a search, not cleared")
+
+    def get_visits(self, node: int, action: int) -> int:
+        row = self._row(node, action_slot(action))
+        return int(self.visit_counts[row] + self.virtual_visits[row])
+
+    def get_value(self, node: int, action: int, player: int) -> float:
+        row = self._row(node, action_slot(action))
+        visits = self.visit_counts[row]
+        virtual_visits = self.virtual_visits[row]
+        if virtual_visits == 0:
+            return float(self.action_values[row, player])
+        total = self.action_values[row, player] * visits + SharedSearchTree.VIRTUAL_LOSS_VALUE * virtual_visits
+        return float(total / (visits + virtual_visits))
+
+    def get_total_visits(self, node: int) -> int:
+        return int(self.node_visits[node] + self.node_virtual_visits[node])
+
+    def slot_statistics(self, node: int, slots: np.ndarray, player: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows = self._rows(node, slots)
+        visits = self.visit_counts[rows]
+        q_values = self.action_values[rows, player]
+        virtual_visits = self.virtual_visits[rows]
+        if not virtual_visits.any():
+            return visits, q_values
+        total_visits = visits + virtual_visits
+        # same blend as get_value, only where virtual visits are held
+        total_values = q_values * visits + SharedSearchTree.VIRTUAL_LOSS_VALUE * virtual_visits
+        q_values = np.divide(total_values, total_visits, out=q_values.copy(), where=virtual_visits != 0)
+        return total_visits, q_values
+
+    def add_virtual_loss(self, node: int, action: int):
+        self.virtual_visits[self._row(node, action_slot(action))] += self.virtual_loss
+        self.node_virtual_visits[node] += self.virtual_loss
+
+    def revert_virtual_loss(self, node: int, action: int):
+        self.virtual_visits[self._row(node, action_slot(action))] -= self.virtual_loss
+        self.node_virtual_visits[node] -= self.virtual_loss
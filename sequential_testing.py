@@ -0,0 +1,92 @@
+import statistics
+from environment import *
+
+
+class SequentialStopReason(str, enum.Enum):
+    WIDTH = 'width'  # The confidence interval became narrower than the target width
+    DECIDED = 'decided'  # The confidence interval excludes 0: the sign of the profit is settled
+    MAX_EPISODES = 'max_episodes'  # The episode budget ran out first
+
+
+@dataclass
+class RunningMoments:
+    '''
+    Running mean and variance of a stream of values (Welford's algorithm), numerically stable in one pass.
+    '''
+    count: int = 0
+    mean: float = 0.0
+    sum_squared_deviations: float = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.sum_squared_deviations += delta * (value - self.mean)
+
+    def variance(self) -> float:
+        return self.sum_squared_deviations / (self.count - 1) if self.count > 1 else 0.0
+
+    def standard_error(self) -> float:
+        return math.sqrt(self.variance() / self.count) if self.count > 0 else math.inf
+
+
+@dataclass
+class SequentialReport:
+    '''
+    How an adaptive run of simulate_until_settled ended.
+    '''
+    episodes: int
+    mean: float  # Average profit of player 0
+    standard_error: float
+    interval: Tuple[float, float]  # Confidence interval of player 0's average profit at the last look
+    looks: int  # Interim analyses made
+    stop_reason: SequentialStopReason
+
+
+def simulate_until_settled(simulator: Simulator, max_episodes: int, target_width: Optional[float] = None,
+                           confidence: float = 0.95, check_interval: int = 100,
+                           min_episodes: int = 100) -> Tuple[SimulatorResults, SequentialReport]:
+    '''
+    Plays episodes until the average profit of player 0 is known well enough, at most max_episodes.
+
+    Every check_interval episodes (from min_episodes on) a confidence interval is computed from the running mean and
+    variance. The run stops when the interval is narrower than target_width (if set) or when it excludes 0, i.e.
+    which player profits is decided. The intervals are Bonferroni-corrected for the maximum number of looks, so the
+    final interval keeps its coverage however early the run stops.
+    '''
+    max_looks = max(1, math.ceil((max_episodes - min_episodes) / check_interval) + 1)
+    z = statistics.NormalDist().inv_cdf(1 - (1 - confidence) / (2 * max_looks))
+    start = time.perf_counter()
+    simulator.stats = SimulatorStats() if simulator.instrument else None
+    totals = SimulatorTotals()
+    profits = RunningMoments()
+    looks = 0
+    stop_reason = SequentialStopReason.MAX_EPISODES
+    for record in simulator.stream_episodes(max_episodes):
+        totals.add_record(record)
+        profits.add(record.returns[0])
+        if profits.count < min_episodes or (profits.count - min_episodes) % check_interval != 0:
+            continue
+        looks += 1
+        half_width = z * profits.standard_error()
+        if target_width is not None and 2 * half_width <= target_width:
+            stop_reason = SequentialStopReason.WIDTH
+            break
+        if abs(profits.mean) > half_width:
+            stop_reason = SequentialStopReason.DECIDED
+            break
+    simulator._finish_stats(start)
+
+    half_width = z * profits.standard_error()
+    report = SequentialReport(episodes=profits.count, mean=profits.mean, standard_error=profits.standard_error(),
+                              interval=(profits.mean - half_width, profits.mean + half_width), looks=looks,
+                              stop_reason=stop_reason)
+    return totals.to_results(), report
+
+
+if __name__ == '__main__':
+    from mcts import HistoryMCTSPlayer
+
+    simulator = Simulator([HistoryMCTSPlayer(num_simulations=100, exploration_constant=1.0), RandomPlayer()])
+    results, report = simulate_until_settled(simulator, max_episodes=1000)
+    print(report)
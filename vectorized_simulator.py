@@ -0,0 +1,90 @@
+from policy_table import *
+from rollouts import *
+
+_DEAL_ARRAY = np.array(DEALS, dtype=np.int64)  # DEALS as rows of (card 0, card 1), for sampling deals in bulk
+
+
+def as_policy_table(player) -> PolicyTable:
+    '''
+    The PolicyTable a player plays by. Only RandomPlayer, TablePlayer and plain tables can be simulated in bulk.
+    '''
+    if isinstance(player, PolicyTable):
+        return player
+    if isinstance(player, TablePlayer):
+        return player.table
+    if isinstance(player, RandomPlayer):
+        return PolicyTable.uniform()
+    raise ValueError(f"{type(player).__name__} has no policy table; compile it with compile_policy first")
+
+
+def sample_table_actions(batch: RolloutBatch, tables: List[PolicyTable], cumulative: List[np.ndarray]) -> np.ndarray:
+    '''
+    Samples the action of the player to act in every running game of the batch from that player's table
+    (entries of finished games are ignored). cumulative holds the per-row CDFs of the tables.
+    '''
+    actions = np.zeros(len(batch), dtype=np.int64)
+    active = batch.active()
+    for player, (table, cdfs) in enumerate(zip(tables, cumulative)):
+        rows = np.flatnonzero(active & (batch.current_player == player))
+        cards = batch.players_hands[rows, player]
+        bet_amounts = batch.bet_amount[rows]
+        opening = bet_amounts == NO_BET
+
+        # opening decisions: one CDF per card (opening rows are indexed by card)
+        for card in KuhnPokerState.DECK:
+            games = rows[opening & (cards == card)]
+            cdf = cdfs[card]
+            actions[games] = cdf.searchsorted(np.random.random(len(games)) * cdf[-1], side='right') + ActionType.FOLD
+
+        # responses: fold or call, with the probabilities of the two legal actions
+        games = rows[~opening]
+        bet_amounts = bet_amounts[~opening]
+        infosets = infoset_index(cards[~opening], 1, bet_amounts)
+        fold_probabilities = table.probabilities[infosets, action_slot(ActionType.FOLD)]
+        call_probabilities = table.probabilities[infosets, CALL_SLOTS[bet_amounts]]
+        fold = np.random.random(len(games)) * (fold_probabilities + call_probabilities) < fold_probabilities
+        actions[games] = np.where(fold, ActionType.FOLD, bet_amounts)
+    return actions
+
+
+class VectorizedSimulator:
+    '''
+    Plays whole batches of episodes between two table (or random) policies with array operations.
+
+    Produces the same SimulatorResults as Simulator.simulate_episodes: the rules and returns are those of
+    RolloutBatch, which mirrors KuhnPokerState, and actions are drawn from the players' policy tables.
+    Randomness comes from np.random.
+    '''
+    def __init__(self, players: List, batch_size: int = 1_000_000):
+        self.tables = [as_policy_table(player) for player in players]
+        self.cumulative = [np.cumsum(table.probabilities, axis=1) for table in self.tables]
+        self.batch_size = batch_size  # Episodes played together; bounds memory use
+
+    def play_batch(self, num_episodes: int) -> RolloutBatch:
+        '''
+        Deals and plays num_episodes episodes together and returns the finished batch.
+        '''
+        batch = RolloutBatch.from_hands(_DEAL_ARRAY[np.random.randint(len(DEALS), size=num_episodes)])
+        while not batch.all_terminal():
+            batch.apply_actions(sample_table_actions(batch, self.tables, self.cumulative))
+        return batch
+
+    def run_episodes(self, num_episodes: int) -> SimulatorTotals:
+        totals = SimulatorTotals()
+        for start in range(0, num_episodes, self.batch_size):
+            batch = self.play_batch(min(self.batch_size, num_episodes - start))
+            totals.add_batch(batch.players_hands, batch.get_returns(), batch.bets.sum(axis=1))
+        return totals
+
+    def simulate_episodes(self, num_episodes: int, seed: Optional[int] = None) -> SimulatorResults:
+        if seed is not None:
+            np.random.seed(seed % 2**32)
+        return self.run_episodes(num_episodes).to_results()
+
+
+if __name__ == '__main__':
+    simulator = VectorizedSimulator([RandomPlayer(), RandomPlayer()])
+    start = time.perf_counter()
+    results = simulator.simulate_episodes(1_000_000, seed=0)
+    print(f"1000000 episodes in {time.perf_counter() - start:.2f}s")
+    print(results)